@@ -14,11 +14,14 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
-from os.path import exists, getsize, split, isdir, isfile, relpath
-from os import listdir
+from argparse import ArgumentParser
+from os import stat
+from os.path import abspath, exists, split, isdir, isfile, relpath
 from hashlib import md5
-import sys
-from time import time
+from typing import Optional, Tuple
+from hash_util import BLOCK_SIZE, HashCache, feed_file, imap_ordered
+from progress_util import ProgressReporter
+from util import walk
 
 
 def listdirc(path: str, path2: str = None):
@@ -26,63 +29,126 @@ def listdirc(path: str, path2: str = None):
         path2 = path + '/'
     elif path2 is None:
         path2 = path
-    l = listdir(path)
-    r = []
-    for i in l:
-        fn = f'{path}/{i}'
-        if exists(fn):
-            if isfile(fn):
-                r.append({'fn': fn, 'path': path2})
-            elif isdir(fn):
-                r = r + listdirc(fn, path2)
-    return r
+    return [{'fn': e.path, 'path': path2} for e in walk(path)]
 
 
 limit_size = 256 * 1024
 
-if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        filel = sys.argv[1:]
-    else:
-        filel = ['.']
+
+def rapid_digest(fn: str, block_size: int = BLOCK_SIZE,
+                 callback=None) -> Tuple[str, str, int]:
+    # Returns (md5 of the whole file, md5 of the first 256 KiB, size). Both
+    # digests come from the same read pass, the chunk which crosses the
+    # slice boundary is split there.
+    md = md5()
+    r = 0
+    md51 = None
+
+    def update(t: memoryview):
+        nonlocal r, md51
+        n = len(t)
+        if md51 is None and r + n >= limit_size:
+            k = limit_size - r
+            md.update(t[:k])
+            md51 = md.hexdigest()
+            md.update(t[k:])
+        else:
+            md.update(t)
+        r += n
+    feed_file(fn, update, callback, block_size)
+    md52 = md.hexdigest()
+    if md51 is None:
+        md51 = md52
+    return md52, md51, r
+
+
+p = ArgumentParser(description='Generate rapid upload links of Baidu Netdisk.')  # noqa: E501
+p.add_argument('-o', '--output', help='The path to output file. Default: bdshare.txt.', default='bdshare.txt')  # noqa: E501
+p.add_argument('-j', '--jobs', help='The number of files to hash at the same time. Default: 1.', type=int, default=1)  # noqa: E501
+p.add_argument('-c', '--cache', help='The path to the cache database. Files whose size, mtime and inode are unchanged reuse cached digests. Default: .bdshare.db.', default='.bdshare.db')  # noqa: E501
+p.add_argument('-C', '--no-cache', help='Do not use the cache database.', action='store_true')  # noqa: E501
+p.add_argument('input', help='The path to the input file or directory.', nargs='*', default=['.'])  # noqa: E501
+
+
+def main(args=None):
+    arg = p.parse_intermixed_args(args)
     file_list = []
-    for i in filel:
+    for i in arg.input:
         if exists(i):
             if isfile(i):
                 file_list.append({'fn': i, 'path': ''})
             elif isdir(i):
-                file_list = file_list + listdirc(i)
+                file_list.extend(listdirc(i))
+    if not arg.no_cache:
+        cache = HashCache(arg.cache)
+        cache_file = abspath(arg.cache)
+        file_list = [j for j in file_list if abspath(j['fn']) != cache_file]
+    else:
+        cache = None
     e = 1
     l = len(file_list)
-    f2 = open('bdshare.txt', 'w', encoding='utf8')
-    for j in file_list:
+    progress = ProgressReporter("Hashing...", l)
+
+    def lookup(i: str) -> Optional[Tuple[str, str, int]]:
+        try:
+            st = stat(i)
+        except OSError:
+            return None
+        k = abspath(i)
+        r1 = cache.lookup(k, 'md5', st)
+        r2 = cache.lookup(k, 'md5_slice', st)
+        if r1 is None or r2 is None:
+            return None
+        return r1[0], r2[0], st.st_size
+
+    def todo():
+        # Cache lookups are done here on the main thread, only misses are
+        # hashed by the workers.
+        for j in file_list:
+            if cache is not None:
+                r = lookup(j['fn'])
+                if r is not None:
+                    j['digest'] = r
+            yield j
+
+    def compute(j: dict) -> Optional[Tuple[str, str, int]]:
+        if 'digest' in j:
+            return j['digest']
         i = j['fn']
-        if exists(i):
-            fs = getsize(i)
-            with open(i, 'rb', 1024) as f:
-                md = md5()
-                r = 0
-                t1 = time()
-                t = f.read(1024)
-                while len(t) > 0:
-                    r += len(t)
-                    md.update(t)
-                    if r == limit_size:
-                        md51 = md.hexdigest()
-                    t2 = time()
-                    if t2 > t1 + 1:
-                        t1 = t2
-                        print(f"\r[{e}/{l}]{'%.2f'%(r/fs*100)}%", end='')
-                    t = f.read(1024)
-                md52 = md.hexdigest()
-                if fs < limit_size:
-                    md51 = md52
-                if j['path'] != "":
-                    pa = relpath(i, j["path"])
-                else:
-                    pa = split(i)[1]
-                share = f'{md52}#{md51}#{fs}#{pa}'
-                f2.write(share+'\n')
-                print(f"\r[{e}/{l}]:{share}")
-        e = e + 1
-    f2.close()
+        if not exists(i):
+            return None
+        j['stat'] = stat(i)
+        callback = progress.begin(i, j['stat'].st_size)
+        try:
+            return rapid_digest(i, callback=callback)
+        finally:
+            progress.end(i)
+
+    try:
+        with open(arg.output, 'w', encoding='utf8') as f2, progress:
+            for j, r, err in imap_ordered(compute, todo(), arg.jobs):
+                i = j['fn']
+                if err is not None:
+                    raise err
+                if r is not None:
+                    md52, md51, fs = r
+                    if cache is not None and 'stat' in j:
+                        k = abspath(i)
+                        cache.store(k, 'md5', j['stat'], md52)
+                        cache.store(k, 'md5_slice', j['stat'], md51)
+                    if j['path'] != "":
+                        pa = relpath(i, j["path"])
+                    else:
+                        pa = split(i)[1]
+                    share = f'{md52}#{md51}#{fs}#{pa}'
+                    f2.write(share+'\n')
+                    progress.print(f"[{e}/{l}]:{share}")
+                progress.advance()
+                e = e + 1
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+if __name__ == "__main__":
+    main()
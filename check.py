@@ -18,9 +18,9 @@ from getopt import getopt
 import sys
 from os import listdir
 from os.path import getsize, exists
-from re import search
-from subprocess import Popen, PIPE
 from json import dumps, loads
+from hash_util import hash_file, imap_ordered
+from progress_util import ProgressReporter
 
 
 def help():
@@ -29,7 +29,7 @@ def help():
     check.py -g filename [ext1 ext2 ...]    生成JSON校验文件
     ext1等是要生成校验的文件的扩展名
     如不指定，默认列表为"mp4 webm m4a"。
-    注：程序需要UNIX工具sha256sum才能工作''')
+    -j N    同时计算N个文件的散列值，默认为1''')
 
 
 def isok(fn: str, ext: list) -> bool:
@@ -49,34 +49,37 @@ def getfilelist(path: str = ".", ext: list = ['mp4', 'webm', 'm4a']) -> list:
     return r
 
 
-def getsha256(fn: str) -> str:
-    p = Popen(f'sha256sum "{fn}"', shell=True, stdout=PIPE)
-    f = p.stdout
-    r = f.read().decode('utf8')
-    rs = search(r'([0-9a-f]+)', r)
-    if rs is not None:
-        return rs.groups()[0]
-    else:
-        raise Exception(f"ERROR:{r}")
+def getsha256(fn: str, callback=None) -> str:
+    return hash_file(fn, 'sha256', callback)
 
 
 def main(opt: dict):
+    jobs = opt.get('j', 1)
+    progress = None
+
+    def compute(fn: str) -> str:
+        callback = progress.begin(fn, getsize(fn))
+        try:
+            return getsha256(fn, callback)
+        finally:
+            progress.end(fn)
     if 'g' in opt:
         if 'ext' in opt:
             file_list = getfilelist(ext=opt['ext'])
         else:
             file_list = getfilelist()
         result = []
-        ii = 1
-        l = len(file_list)
-        for i in file_list:
-            t = {}
-            print(f'\r [{ii}/{l}]"{i}"', end='')
-            t['filename'] = i
-            t['size'] = getsize(i)
-            t['sha256'] = getsha256(i)
-            result.append(t)
-            ii = ii+1
+        progress = ProgressReporter('正在生成', len(file_list))
+        with progress:
+            for i, sha256, e in imap_ordered(compute, file_list, jobs):
+                if e is not None:
+                    raise e
+                t = {}
+                t['filename'] = i
+                t['size'] = getsize(i)
+                t['sha256'] = sha256
+                result.append(t)
+                progress.advance()
         f = open(opt['o'], 'w', encoding='utf8')
         f.write(dumps(result))
         f.close()
@@ -84,27 +87,44 @@ def main(opt: dict):
         f = open(opt['o'], 'r', encoding='utf8')
         file_list = loads(f.read())
         f.close()
-        ii = 1
-        l = len(file_list)
-        for i in file_list:
-            fn = i['filename']
-            print(f'\r [{ii}/{l}]"{fn}"', end='')
-            if exists(fn):
-                if getsize(fn) != i['size']:
-                    print(f'\r文件大小不一致："{fn}"')
-                elif getsha256(fn) != i['sha256']:
-                    print(f'\r文件sha256散列值不一致："{fn}"')
-            else:
-                print(f'\r找不到文件："{fn}"')
-            ii = ii+1
+        progress = ProgressReporter('正在校验', len(file_list))
+
+        def todo():
+            # The cheap existence and size checks run before any hashing,
+            # only files which pass them are hashed by the workers.
+            for i in file_list:
+                fn = i['filename']
+                if not exists(fn):
+                    i['error'] = f'找不到文件："{fn}"'
+                elif getsize(fn) != i['size']:
+                    i['error'] = f'文件大小不一致："{fn}"'
+                yield i
+
+        def check(i: dict):
+            if 'error' in i:
+                return None
+            return compute(i['filename'])
+
+        with progress:
+            for i, sha256, e in imap_ordered(check, todo(), jobs):
+                fn = i['filename']
+                if e is not None:
+                    raise e
+                if 'error' in i:
+                    progress.print(i['error'])
+                elif sha256 != i['sha256']:
+                    progress.print(f'文件sha256散列值不一致："{fn}"')
+                progress.advance()
     else:
         help()
 
 
 if len(sys.argv) > 1:
-    ch = getopt(sys.argv[1:], 'gch')
+    ch = getopt(sys.argv[1:], 'gchj:')
     r = {}
     for i in ch[0]:
+        if i[0] == '-j':
+            r['j'] = int(i[1])
         if i[0] == '-g':
             r['g'] = True
         if i[0] == '-c':
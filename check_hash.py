@@ -1,23 +1,23 @@
-from argparse import ArgumentParser
-import hashlib
+from argparse import ArgumentParser, ArgumentTypeError
+from collections import deque
+from itertools import chain
 import json
-from os.path import abspath, exists, getsize, join, relpath
-try:
-    from rich.live import Live
-    from rich.progress import (
-        Progress,
-        SpinnerColumn,
-        BarColumn,
-        TextColumn,
-        TimeRemainingColumn,
-        TransferSpeedColumn,
-        DownloadColumn,
-        MofNCompleteColumn,
-    )
-    from rich.table import Table
-    have_rich = True
-except ImportError:
-    have_rich = False
+from os import fsync, remove, replace, sep
+from os.path import abspath, exists, getsize, join, relpath, splitext
+from hash_util import (
+    BLOCK_SIZE,
+    COST_ORDER,
+    METHODS,
+    count_manifest,
+    detect_method,
+    hash_file,
+    iter_hashes,
+    iter_manifest,
+    open_manifest,
+    parse_size,
+    parse_tagged,
+)
+from progress_util import ProgressReporter
 
 
 OK = 0
@@ -25,25 +25,109 @@ CHECKSUM_FAILED = 1
 FILE_NOT_EXISTS = 2
 
 
+def size_type(s: str) -> int:
+    try:
+        return parse_size(s)
+    except ValueError:
+        raise ArgumentTypeError(f"invalid size: {s}")
+
+
 p = ArgumentParser(description='Check checksum of files.')
-p.add_argument("-m", "--method", help='The hash method to use. Default: auto. Available choices: auto, md5, sha1, sha224, sha256, sha384, sha512.', choices=['auto', 'md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512'], metavar='METHOD', default="auto")  # noqa: E501
+p.add_argument("-m", "--method", help='The hash method to use. Default: auto. Available choices: auto, ' + ', '.join(METHODS) + '.', choices=['auto'] + METHODS, metavar='METHOD', default="auto")  # noqa: E501
 p.add_argument("-f", "--file", help="The path to the checksum file. Default: checksum.txt. Releative path is relative to the input directory.", default="checksum.txt")  # noqa: E501
 p.add_argument("-o", "--output", help="The path to the result file. Default: .checksum.json. Releative path is relative to the input directory.", default=".checksum.json")  # noqa: E501
 p.add_argument("-F", "--force", help="Force rechecking.", action='store_true')
+p.add_argument("-j", "--jobs", help='The number of files to check at the same time. Default: 1.', type=int, default=1)  # noqa: E501
+p.add_argument("-P", "--process", help='Use a process pool instead of a thread pool when jobs is greater than 1.', action='store_true')  # noqa: E501
+p.add_argument("-b", "--block-size", help='The size of the read buffer in bytes. Default: 1048576.', type=int, default=BLOCK_SIZE)  # noqa: E501
+p.add_argument("--mmap", help='Map files into memory instead of reading them into a buffer.', action='store_true')  # noqa: E501
+p.add_argument("--nocache", help='Drop hashed files from the page cache, so hashing a large tree does not evict the cache of other programs. Only works on systems which support posix_fadvise.', action='store_true')  # noqa: E501
+p.add_argument("--bwlimit", help='Limit the total read speed, in bytes per second. Suffixes K, M and G can be used, e.g. 50M.', type=size_type, metavar='RATE')  # noqa: E501
+p.add_argument("-J", "--journal", help="The path to the journal file which records every checked file, so an interrupted check can be resumed. Default: .checksum.journal. Releative path is relative to the input directory.", default=".checksum.journal")  # noqa: E501
+p.add_argument("--journal-batch", help='Flush the journal to disk after this many files. Default: 100.', type=int, default=100)  # noqa: E501
+p.add_argument("--compact", help='Only merge the journal into the result file and remove it, without checking files.', action='store_true')  # noqa: E501
+p.add_argument("-s", "--subtree", help='Only check files under this path, can be specified multiple times. Releative path is relative to the input directory. Useful together with diff_hash.py.', action='append')  # noqa: E501
 p.add_argument("input", help='The path to the input file or directory.', nargs='*', default=['.'])  # noqa: E501
 
 
-def checksum(file: str, method: str, task=None, progress=None):
-    h = hashlib.new(method)
-    with open(file, 'rb') as f:
-        while True:
-            data = f.read(40960)
-            if not data:
+def checksum(file: str, method: str, task=None, progress=None,
+             block_size: int = BLOCK_SIZE, use_mmap: bool = False):
+    if progress is not None and task is not None:
+        def callback(size: int):
+            progress.update(task, advance=size)
+    else:
+        callback = None
+    return hash_file(file, method, callback, block_size, use_mmap)
+
+
+class Journal:
+    def __init__(self, path: str, batch: int = 100):
+        self._f = open(path, 'a', encoding='UTF-8', newline='\n')
+        self._batch = batch
+        self._count = 0
+
+    def add(self, file: str, r: int):
+        self._f.write(json.dumps([file, r], ensure_ascii=False) + '\n')
+        self._count += 1
+        if self._count >= self._batch:
+            self.flush()
+
+    def close(self):
+        if self._f is not None:
+            self.flush()
+            self._f.close()
+            self._f = None
+
+    def flush(self):
+        self._f.flush()
+        fsync(self._f.fileno())
+        self._count = 0
+
+
+def replay_journal(path: str, result: dict):
+    try:
+        f = open(path, encoding='UTF-8')
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            try:
+                file, r = json.loads(line)
+            except Exception:
+                # The last line may be incomplete after a crash.
                 break
-            h.update(data)
-            if progress is not None and task is not None:
-                progress.update(task, advance=len(data))
-    return h.hexdigest()
+            result[file] = r
+
+
+def save_result(result_file: str, result: dict, ok: bool):
+    tmp = result_file + '.tmp'
+    with open(tmp, encoding='UTF-8', mode='w') as f:
+        json.dump({'ok': ok, 'result': result}, f, ensure_ascii=False,
+                  indent=2)
+    replace(tmp, result_file)
+
+
+def compact(result_file: str, journal_file: str, result: dict, ok: bool):
+    # The result file is replaced atomically before the journal is removed,
+    # so a crash in between only leaves a journal which replays the same
+    # results.
+    save_result(result_file, result, ok)
+    if exists(journal_file):
+        remove(journal_file)
+
+
+def find_checksum_file(input: str, file: str, method: str) -> str:
+    checksum_file = join(input, file)
+    if exists(checksum_file):
+        return checksum_file
+    # Fall back to the per method manifests written by gen_hash.py when
+    # several methods are used, preferring the cheapest one.
+    name, ext = splitext(checksum_file)
+    for m in COST_ORDER if method == 'auto' else [method]:
+        f = f"{name}.{m}{ext}"
+        if exists(f):
+            return f
+    return checksum_file
 
 
 def print_result(result, start: str):
@@ -68,108 +152,107 @@ def print_result(result, start: str):
     return ok
 
 
+def check(arg, input: str, checksum_file: str, entries, method: str,
+          tagged: bool, result: dict, journal: Journal):
+    base = abspath(input)
+    # Files listed in the manifest, used to prune stale results.
+    seen = set()
+    subtrees = [abspath(join(input, i)) for i in arg.subtree or []]
+    # Expected digests of files which are being hashed, in manifest order.
+    sums = deque()
+    # Compressed manifests are not counted in advance, the files of the
+    # previous run are used as an estimate until the end of the manifest.
+    total = count_manifest(checksum_file)
+    progress = ProgressReporter("Checking checksum...",
+                                total if total is not None else len(result) or None)  # noqa: E501
+
+    def files():
+        for sum, name in entries:
+            file = abspath(join(input, name))
+            if tagged:
+                sum = parse_tagged(sum)[method]
+            seen.add(file)
+            if subtrees and not any(file == i or file.startswith(i + sep)
+                                    for i in subtrees):
+                progress.advance()
+                continue
+            if file in result and result[file] == 0:
+                progress.advance()
+                continue
+            if not exists(file):
+                result[file] = FILE_NOT_EXISTS
+                journal.add(file, FILE_NOT_EXISTS)
+                progress.advance()
+                continue
+            sums.append(sum)
+            yield file
+        progress.total = len(seen)
+
+    def begin(file: str):
+        return progress.begin(relpath(file, base), getsize(file))
+
+    def end(file: str):
+        progress.end(relpath(file, base))
+    with progress:
+        for file, rsum, e in iter_hashes(files(), method, arg.jobs,
+                                         arg.process, begin, end,
+                                         arg.block_size, arg.mmap,
+                                         arg.nocache, arg.bwlimit):
+            sum = sums.popleft()
+            if e is not None:
+                result[file] = CHECKSUM_FAILED
+            elif rsum == sum:
+                result[file] = OK
+                msg = 'OK'
+            else:
+                result[file] = CHECKSUM_FAILED
+                msg = 'FAILED'
+            journal.add(file, result[file])
+            if e is None and not progress.rich:
+                print(f"{relpath(file, base)}: {msg}")
+            progress.advance()
+    return seen
+
+
 def main(args=None):
     arg = p.parse_intermixed_args(args)
     for input in arg.input:
         result = {}
         result_file = join(input, arg.output)
+        journal_file = join(input, arg.journal)
         if not arg.force:
             try:
                 with open(result_file, encoding='UTF-8') as f:
                     result = json.load(f)['result']
             except Exception:
                 pass
-        checksum_file = join(input, arg.file)
-        with open(checksum_file, encoding='UTF-8') as f:
-            lines = [i.split("  ") for i in f.readlines() if i.strip()]
-            if len(lines) == 0:
+            replay_journal(journal_file, result)
+        elif exists(journal_file):
+            remove(journal_file)
+        if arg.compact:
+            ok = print_result(result, abspath(input))
+            compact(result_file, journal_file, result, ok)
+            continue
+        checksum_file = find_checksum_file(input, arg.file, arg.method)
+        with open_manifest(checksum_file) as f:
+            header = {}
+            entries = iter_manifest(f, header)
+            first = next(entries, None)
+            if first is None:
                 print('No checksum entries found.')
                 continue
-        if arg.method == 'auto':
-            h = lines[0][0]
-            if len(h) == 32:
-                method = 'md5'
-            elif len(h) == 40:
-                method = 'sha1'
-            elif len(h) == 56:
-                method = 'sha224'
-            elif len(h) == 64:
-                method = 'sha256'
-            elif len(h) == 96:
-                method = 'sha384'
-            elif len(h) == 128:
-                method = 'sha512'
-            else:
-                raise ValueError('Unknown hash method.')
-        else:
-            method = arg.method
-        if have_rich:
-            progress = Progress("{task.description}",
-                                SpinnerColumn(),
-                                BarColumn(),
-                                TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),  # noqa: E501
-                                MofNCompleteColumn(),
-                                )
-            job_progress = Progress("{task.description}",
-                                    SpinnerColumn(),
-                                    BarColumn(),
-                                    TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),  # noqa: E501
-                                    DownloadColumn(),
-                                    TransferSpeedColumn(),
-                                    TimeRemainingColumn(),
-                                    )
-            total_tasks = progress.add_task("Checking checksum...",
-                                            total=len(lines))
-            progress_table = Table.grid()
-            progress_table.add_row(progress)
-            progress_table.add_row(job_progress)
-            live = Live(progress_table, refresh_per_second=10)
-            live.start()
-        else:
-            task = None
-            job_progress = None
-        files = []
-        for line in lines:
-            file = abspath(join(input, "  ".join(line[1:]).strip('\n')))
-            sum = line[0]
-            files.append(file)
-            if file in result and result[file] == 0:
-                if have_rich:
-                    progress.update(total_tasks, advance=1)
-                continue
-            if not exists(file):
-                result[file] = FILE_NOT_EXISTS
-                if have_rich:
-                    progress.update(total_tasks, advance=1)
-                continue
-            rp = relpath(file, abspath(input))
-            if have_rich:
-                task = job_progress.add_task(f"Checking {rp}...",
-                                             total=getsize(file))
+            entries = chain([first], entries)
+            method, tagged = detect_method(first[0], arg.method, header)
+            journal = Journal(journal_file, arg.journal_batch)
             try:
-                rsum = checksum(file, method, task, job_progress)
-                if rsum == sum:
-                    result[file] = OK
-                    msg = 'OK'
-                else:
-                    result[file] = CHECKSUM_FAILED
-                    msg = 'FAILED'
-                if not have_rich:
-                    print(f"{rp}: {msg}")
-            except Exception:
-                result[file] = CHECKSUM_FAILED
+                seen = check(arg, input, checksum_file, entries, method,
+                             tagged, result, journal)
             finally:
-                if have_rich:
-                    progress.update(total_tasks, advance=1)
-                    job_progress.remove_task(task)
-        if have_rich:
-            live.stop()
-        if len(result) != len(files):
-            result = {i: result[i] for i in result if i in files}
+                journal.close()
+        if len(result) != len(seen):
+            result = {i: result[i] for i in result if i in seen}
         ok = print_result(result, abspath(input))
-        with open(result_file, encoding='UTF-8', mode='w') as f:
-            json.dump({'ok': ok, 'result': result}, f, ensure_ascii=False,
-                      indent=2)
+        compact(result_file, journal_file, result, ok)
 
 
 if __name__ == '__main__':
@@ -15,13 +15,16 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 from argparse import ArgumentParser, Namespace
+from functools import partial
 from json import dump as dumpjson, load as loadjson
-from os import listdir
-from os.path import abspath, isdir, isfile, join, relpath, split as splitpath
+from os.path import abspath, dirname, exists, join, relpath
+from os.path import split as splitpath
 from os.path import splitext
-from typing import Any, Callable, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 import xml.etree.ElementTree as ET
 from zipfile import ZipFile
+from hash_util import imap_ordered
+from util import walk
 try:
     from yaml import dump as dumpyaml, load as loadyaml
     try:
@@ -40,6 +43,8 @@ argp.add_argument('PATH', action='append', nargs='*', help='The path to the libr
 argp.add_argument('-f', '--file', help='The location of the file which contains comic info.')  # noqa: E501
 argp.add_argument('-t', '--type', help='The type of the file which contains comic info.', choices=['json', 'yaml'])  # noqa: E501
 argp.add_argument('-b', '--base', help='The base directory.')
+argp.add_argument('-i', '--incremental', help='Load the previous dump from the file and reuse the info of cbz files whose size and mtime are unchanged.', action='store_true')  # noqa: E501
+argp.add_argument('-j', '--jobs', help='The number of processes used to read cbz files when dumping. Default: 1.', type=int, default=1)  # noqa: E501
 
 
 def guess_type_from_file_name(fn: str) -> Optional[str]:
@@ -325,7 +330,7 @@ def parse_xml(content: Union[str, bytes]) -> Optional[Dict[str, Any]]:
     return obj
 
 
-def iter_path(args: Namespace, path: str, data: object):
+def get_tree(args: Namespace, path: str, data: object):
     rpath = relpath(path, args.base)
     path_list = split_path(rpath)
     if args.verbose > 2:
@@ -338,50 +343,109 @@ def iter_path(args: Namespace, path: str, data: object):
             else:
                 tdata[p]
         tdata = tdata[p]['tree']
-    for f in listdir(path):
-        fpath = join(path, f)
-        rfpath = relpath(fpath, args.base)
-        if args.verbose > 0:
-            print(f'Scan {rfpath}')
-        if isdir(fpath):
-            iter_path(args, fpath, data)
-        elif isfile(fpath):
-            fn = splitpath(fpath)[1]
-            typ = guess_type(fn)
-            if args.verbose > 2:
-                print(f'Guess type: {typ}')
-            if typ == 'cbz':
-                tdata[fn] = {'type': 'cbz', 'comic_info': None}
-                if args.ACTION in ['d', 'dump']:
-                    with ZipFile(fpath, 'r', allowZip64=True) as z:
-                        if args.verbose > 1:
-                            print(f"Opened {rfpath}.")
-                        try:
-                            info = z.getinfo("ComicInfo.xml")
-                            if args.verbose > 2:
-                                print(f"ComicInfo.xml information: {info}")
-                        except KeyError:
-                            info = None
-                        if info is not None:
-                            try:
-                                content = z.read(info)
+    return tdata
+
+
+def find_node(data: Dict[str, Any],
+              path_list: List[str]) -> Optional[Dict[str, Any]]:
+    node = None
+    for p in path_list:
+        if data is None or p not in data:
+            return None
+        node = data[p]
+        data = node.get('tree')
+    return node
+
+
+def read_comic_info(fpath: str, rfpath: str,
+                    verbose: int = 0) -> Optional[Dict[str, Any]]:
+    with ZipFile(fpath, 'r', allowZip64=True) as z:
+        if verbose > 1:
+            print(f"Opened {rfpath}.")
+        try:
+            info = z.getinfo("ComicInfo.xml")
+            if verbose > 2:
+                print(f"ComicInfo.xml information: {info}")
+        except KeyError:
+            return None
+        try:
+            content = z.read(info)
+            if verbose > 1:
+                print(f"Opend ComicInfo.xml in {rfpath}")
+            if verbose > 3:
+                print("ComicInfo.xml Content:")
+                try:
+                    content2 = content.decode('UTF-8')
+                except Exception:
+                    content2 = content
+                print(content2)
+            return parse_xml(content)
+        except Exception:
+            return None
+
+
+def read_comic_info_job(job: Tuple[Dict[str, Any], str, str],
+                        verbose: int = 0) -> Optional[Dict[str, Any]]:
+    _, fpath, rfpath = job
+    return read_comic_info(fpath, rfpath, verbose)
+
+
+def iter_path(args: Namespace, path: str, data: object,
+              old: Optional[Dict[str, Any]] = None):
+    # old is the tree of the previous dump. Its info is reused for cbz
+    # files whose size and mtime are unchanged.
+    def scan():
+        # Traversal and the tree stay on the main thread, only the cbz files
+        # are yielded to be read by the workers.
+        trees = {path: get_tree(args, path, data)}
+        for e in walk(path, files_only=False):
+            fpath = e.path
+            rfpath = relpath(fpath, args.base)
+            if args.verbose > 0:
+                print(f'Scan {rfpath}')
+            tdata = trees[dirname(fpath)]
+            if e.is_dir():
+                trees[fpath] = get_tree(args, fpath, data)
+            elif e.is_file():
+                fn = splitpath(fpath)[1]
+                typ = guess_type(fn)
+                if args.verbose > 2:
+                    print(f'Guess type: {typ}')
+                if typ == 'cbz':
+                    tdata[fn] = {'type': 'cbz', 'comic_info': None}
+                    if args.ACTION in ['d', 'dump']:
+                        st = e.stat()
+                        node = tdata[fn]
+                        node['size'] = st.st_size
+                        node['mtime_ns'] = st.st_mtime_ns
+                        if old is not None:
+                            o = find_node(old, split_path(rfpath))
+                            if o is not None and o.get('type') == 'cbz' \
+                                    and o.get('size') == st.st_size \
+                                    and o.get('mtime_ns') == st.st_mtime_ns:
                                 if args.verbose > 1:
-                                    print(f"Opend ComicInfo.xml in {rfpath}")
-                                if args.verbose > 3:
-                                    print("ComicInfo.xml Content:")
-                                    try:
-                                        content2 = content.decode('UTF-8')
-                                    except Exception:
-                                        content2 = content
-                                    print(content2)
-                                info = parse_xml(content)
-                                tdata[fn]['comic_info'] = info
-                            except Exception:
-                                pass
+                                    print(f'Reuse info of {rfpath}')
+                                node['comic_info'] = o['comic_info']
+                                continue
+                        yield node, fpath, rfpath
+                else:
+                    tdata[fn] = {'type': 'file'}
             else:
-                tdata[fn] = {'type': 'file'}
-        else:
-            print(f'{rfpath}({fpath}) has unknown file type.')
+                print(f'{rfpath}({fpath}) has unknown file type.')
+    func = partial(read_comic_info_job, verbose=args.verbose)
+    for job, info, e in imap_ordered(func, scan(), args.jobs, True):
+        if e is not None:
+            raise e
+        job[0]['comic_info'] = info
+
+
+def load_file(args: Namespace) -> Dict[str, Any]:
+    if args.type == 'json':
+        with open(args.file, 'r', encoding='UTF-8') as f:
+            return loadjson(f)
+    elif args.type == 'yaml':
+        with open(args.file, 'r', encoding='UTF-8') as f:
+            return loadyaml(f, SafeLoader)
 
 
 def run(args: Optional[List[str]] = None):
@@ -406,13 +470,19 @@ def run(args: Optional[List[str]] = None):
         data = {'path': [], 'base': args.base, 'tree': {}}
         for p in args.PATH:
             data['path'].append(relpath(abspath(p), args.base))
+        old = None
+        if args.incremental and exists(args.file):
+            old = load_file(args)
+            if old.get('base') != args.base:
+                print('The base of the previous dump is different, ignored.')
+                old = None
+            else:
+                old = old['tree']
+        elif args.incremental and args.verbose > 0:
+            print(f'{args.file} not found, dump all files.')
     elif args.ACTION in ['m', 'modify']:
-        if args.type == 'json':
-            with open(args.file, 'r', encoding='UTF-8') as f:
-                data = loadjson(f)
-        elif args.type == 'yaml':
-            with open(args.file, 'r', encoding='UTF-8') as f:
-                data = loadyaml(f, SafeLoader)
+        data = load_file(args)
+        old = None
         if args.PATH is None:
             for p in data['path']:
                 args.PATH.append(join(args.base, p))
@@ -423,7 +493,7 @@ def run(args: Optional[List[str]] = None):
     if args.verbose > 2:
         print(data)
     for p in args.PATH:
-        iter_path(args, abspath(p), data['tree'])
+        iter_path(args, abspath(p), data['tree'], old)
     if args.ACTION in ['d', 'dump']:
         if args.type == 'json':
             with open(args.file, 'w', encoding='UTF-8') as f:
@@ -3,13 +3,13 @@ from math import floor
 from os.path import basename, dirname, join, splitext
 from re import compile, Match, search
 from sys import argv, exit
-from typing import List, Optional
+from typing import Dict, List, Optional
 try:
-    from _rssbotlib import AVDict, version, VideoInfo
+    from _rssbotlib import version
     have_rssbotlib = True
 except ImportError:
-    AVDict = None
     have_rssbotlib = False
+from probe_cache import ProbeCache
 
 
 RSSBOTLIB_NOTFOUND = '''rssbotlib not found.
@@ -39,8 +39,7 @@ def prase_duration(s: str) -> float:
     return convert_dur(r)
 
 
-def generate_good_filename(meta: AVDict) -> Optional[str]:
-    m = meta.to_dict()
+def generate_good_filename(m: Dict[str, str]) -> Optional[str]:
     if 'title' in m and 'artist' in m:
         return f"{m['artist']} - {m['title']}.lrc"
     elif 'title' in m:
@@ -165,13 +164,15 @@ class Cml:
         self.dir = None
         self.offset = False
         self.in_place = False
+        self.probe_cache = None
         if len(arg) == 0:
             self.print_help()
             exit(0)
         try:
             r = getopt(arg, '-hVvo:f:t:d:i',
                        ['help', 'version', 'verbose', 'output=', 'file=',
-                        'duration=', 'dir=', 'offset', 'in-place'])
+                        'duration=', 'dir=', 'offset', 'in-place',
+                        'probe-cache='])
             for i in r[0]:
                 if i[0] == '-h' or i[0] == '--help':
                     self.print_help()
@@ -193,6 +194,8 @@ class Cml:
                     self.offset = True
                 elif i[0] == '-i' or i[0] == '--in-place':
                     self.in_place = True
+                elif i[0] == '--probe-cache':
+                    self.probe_cache = i[1]
             if len(r[1]) == 0:
                 raise GetoptError('Input lyric file is needed.')
             if len(r[1]) > 1:
@@ -217,7 +220,11 @@ Options:
     -d, --dir <path>        Specify the output directory.
         --offset            Remove offset tag in lryic file and apply offset
                             for lyric.
-    -i, --in-place          Edit lyric in place.''')
+    -i, --in-place          Edit lyric in place.
+        --probe-cache <path>
+                            Path to the probe cache database, default is
+                            ~/.cache/pythonscript/probe.db or $PROBE_CACHE,
+                            use :memory: to disable it.''')
 
     def print_version(self):
         print('convert_lrc.py v1.0.0.0')
@@ -237,13 +244,15 @@ def main() -> int:
     if cml.file is not None:
         if not have_rssbotlib:
             raise NotImplementedError(RSSBOTLIB_NOTFOUND)
-        video_info = VideoInfo()
-        if not video_info.parse(cml.file):
+        try:
+            with ProbeCache(cml.probe_cache) as cache:
+                info = cache.get(cml.file)
+        except ValueError:
             raise Exception(f'Can not parse music file: {cml.file}')
-        dur = video_info.duration
+        dur = info.duration
         if cml.verbose:
             print(f'Get duration from music file: {dur}')
-        metadata = video_info.meta
+        metadata = info.metadata
     if cml.verbose:
         print(f'Duration: {dur}')
     output = None
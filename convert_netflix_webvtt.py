@@ -1,23 +1,14 @@
 from argparse import ArgumentParser
-from os import listdir
-from os.path import isdir, join, exists
+from os.path import isdir, exists
 from typing import List
 import webvtt
+from util import walk
 
 
 def get_vtt_files(dir: str, r: bool) -> List[str]:
     if not isdir(dir):
         return []
-    files = listdir(dir)
-    re = []
-    for file in files:
-        file = join(dir, file)
-        if isdir(file):
-            if r:
-                re += get_vtt_files(file, r)
-        elif file.endswith('.vtt'):
-            re.append(file)
-    return re
+    return [e.path for e in walk(dir, r, include=['*.vtt'])]
 
 
 p = ArgumentParser(description='Convert Netflix WebVTT to SRT')
@@ -1,20 +1,16 @@
-import _rssbotlib
 from argparse import ArgumentParser
 from os import listdir
 from os.path import exists, isdir, join
 from subprocess import PIPE, Popen
 from typing import List
+from probe_cache import ProbeCache, ProbeResult
 
 
-def get_source_size(src) -> (int, int):
-    f = _rssbotlib.VideoInfo()
-    if not f.parse(src):
-        raise ValueError(f"Failed to parse {src}")
-    s = f.streams
-    for i in s:
-        if i.is_video:
-            return i.width, i.height
-    raise ValueError(f"Failed to find video stream in {src}")
+def get_source_size(src, info: ProbeResult) -> (int, int):
+    size = info.video_size
+    if size is None:
+        raise ValueError(f"Failed to find video stream in {src}")
+    return size
 
 
 def get_png_files(dir: str, r: bool) -> List[str]:
@@ -56,14 +52,24 @@ p.add_argument('-f', '--force', action='store_true', default=False,
 p.add_argument('-v', '--verbose', action='store_true', default=False,
                help='Verbose output')
 p.add_argument('-F', '--ffmpeg', help='Path to ffmpeg', default='ffmpeg')
+p.add_argument('-j', '--jobs', type=int, default=1,
+               help='Number of files to probe at the same time')
+p.add_argument('--probe-cache', help='Path to the probe cache database, '
+               'default is ~/.cache/pythonscript/probe.db or $PROBE_CACHE, '
+               'use :memory: to disable it')
 p.add_argument("DIR", help="Directory of the stickers", nargs="+")
 arg = p.parse_intermixed_args()
 print(arg)
-for d in arg.DIR:
-    for f in get_png_files(d, arg.recursive):
+with ProbeCache(arg.probe_cache) as cache:
+    files = []
+    for d in arg.DIR:
+        files += get_png_files(d, arg.recursive)
+    for f, info, e in cache.get_many(files, arg.jobs):
+        if e is not None:
+            raise e
         if arg.verbose:
             print(f"Processing {f}")
-        w, h = get_source_size(f)
+        w, h = get_source_size(f, info)
         if arg.verbose:
             print(f"Source size: {w}x{h}")
         if w > h:
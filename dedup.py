@@ -0,0 +1,110 @@
+from argparse import ArgumentParser
+from os import link, remove, replace, stat
+from os.path import samefile
+from typing import Dict, List, Tuple
+from gen_hash import list_files
+from hash_util import METHODS, hash_edges, iter_hashes, imap_ordered
+
+
+p = ArgumentParser(description='Find duplicate files.')
+p.add_argument('-a', '--all', help='Include all files, including hidden files.', action='store_true')  # noqa: E501
+p.add_argument("-m", "--method", help='The hash method to use. Default: md5. Available choices: ' + ', '.join(METHODS) + '.', choices=METHODS, metavar='METHOD', default="md5")  # noqa: E501
+p.add_argument("-s", "--sample-size", help='The size of the head and tail in bytes which are hashed before hashing the whole file. Default: 4096.', type=int, default=4096)  # noqa: E501
+p.add_argument("--min-size", help='Ignore files smaller than this size in bytes. Default: 1.', type=int, default=1)  # noqa: E501
+p.add_argument("-j", "--jobs", help='The number of files to hash at the same time. Default: 1.', type=int, default=1)  # noqa: E501
+p.add_argument("-H", "--hardlink", help='Replace duplicate files with hard links to the first file of the group.', action='store_true')  # noqa: E501
+p.add_argument("input", help='The path to the input directory.', nargs='*', default=['.'])  # noqa: E501
+
+
+def split_groups(groups: List[List[str]], results) -> List[List[str]]:
+    keys: Dict[Tuple[int, str], List[str]] = {}
+    index = {f: n for n, g in enumerate(groups) for f in g}
+    for f, h, e in results:
+        if e is not None:
+            print(f"Failed to hash {f}: {e}")
+            continue
+        keys.setdefault((index[f], h), []).append(f)
+    return [g for g in keys.values() if len(g) > 1]
+
+
+def find_duplicates(files: List[str], method: str = 'md5',
+                    sample_size: int = 4096, min_size: int = 1,
+                    jobs: int = 1) -> List[List[str]]:
+    # Files are grouped by size first, then by a digest of their head and
+    # tail, and only files which still collide are hashed completely.
+    sizes: Dict[int, List[str]] = {}
+    inodes: Dict[Tuple[int, int], List[str]] = {}
+    keys: Dict[str, Tuple[int, int]] = {}
+    for f in files:
+        try:
+            st = stat(f)
+        except OSError:
+            # Deleted during the walk.
+            continue
+        if st.st_size < min_size:
+            continue
+        # Hard links of the same file are only hashed once.
+        k = (st.st_dev, st.st_ino)
+        if k in inodes:
+            inodes[k].append(f)
+            continue
+        inodes[k] = [f]
+        keys[f] = k
+        sizes.setdefault(st.st_size, []).append(f)
+    groups = [g for g in sizes.values() if len(g) > 1]
+    group_size = {f: size for size, g in sizes.items() for f in g}
+    candidates = [f for g in groups for f in g]
+    groups = split_groups(groups, imap_ordered(
+        lambda f: hash_edges(f, method, sample_size), candidates, jobs))
+    # Head and tail already cover the whole content of small files.
+    full = []
+    re = []
+    for g in groups:
+        if group_size[g[0]] > sample_size * 2:
+            full.append(g)
+        else:
+            re.append(g)
+    candidates = [f for g in full for f in g]
+    re.extend(split_groups(full, iter_hashes(candidates, method, jobs)))
+    return [[p for f in g for p in inodes[keys[f]]] for g in re]
+
+
+def hardlink_group(group: List[str]):
+    src = group[0]
+    for dst in group[1:]:
+        if samefile(src, dst):
+            continue
+        tmp = dst + '.dedup.tmp'
+        try:
+            link(src, tmp)
+        except OSError as e:
+            print(f"Failed to link {src} to {dst}: {e}")
+            continue
+        try:
+            replace(tmp, dst)
+        except OSError as e:
+            remove(tmp)
+            print(f"Failed to link {src} to {dst}: {e}")
+            continue
+        print(f"Linked {src} to {dst}.")
+
+
+def main(args=None):
+    arg = p.parse_intermixed_args(args)
+    files = []
+    for i in arg.input:
+        files.extend(list_files(i, arg.all, jobs=arg.jobs))
+    groups = find_duplicates(files, arg.method, arg.sample_size,
+                             arg.min_size, arg.jobs)
+    for g in groups:
+        for f in g:
+            print(f)
+        print()
+    print(f"Total: {len(groups)} groups of duplicate files.")
+    if arg.hardlink:
+        for g in groups:
+            hardlink_group(g)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+from argparse import ArgumentParser
+from os.path import dirname, exists, getmtime, isdir, join
+from sys import exit
+from typing import Dict, Optional, Set, Tuple
+from hash_util import (
+    METHODS,
+    diff_merkle,
+    get_merkle_output,
+    load_merkle,
+    load_tree,
+    merkle_tree,
+    open_manifest,
+)
+
+
+p = ArgumentParser(description='Compare two checksum files or two directories which contain checksum files.')  # noqa: E501
+p.add_argument("-m", "--method", help='The hash method to compare. Default: auto. Available choices: auto, ' + ', '.join(METHODS) + '.', choices=['auto'] + METHODS, metavar='METHOD', default="auto")  # noqa: E501
+p.add_argument("-f", "--file", help="The path to the checksum file when a directory is given. Default: checksum.txt. Releative path is relative to the directory.", default="checksum.txt")  # noqa: E501
+p.add_argument("old", help='The old checksum file or directory.')
+p.add_argument("new", help='The new checksum file or directory.')
+
+
+def get_manifest(path: str, file: str) -> Tuple[str, str]:
+    # Returns (manifest, base), names in the manifest are relative to base.
+    if isdir(path):
+        return join(path, file), path
+    return path, dirname(path)
+
+
+def load(path: str, file: str, method: str,
+         skip: Optional[Set[str]] = None) -> Tuple[str, Dict]:
+    manifest, base = get_manifest(path, file)
+    with open_manifest(manifest) as f:
+        return load_tree(f, method, base, skip)
+
+
+def load_dirs(path: str, file: str) -> Tuple[Optional[str], Dict[str, str]]:
+    # Loads the directory digests written by gen_hash.py -M, if they are
+    # not older than the manifest.
+    manifest, _ = get_manifest(path, file)
+    merkle = get_merkle_output(manifest)
+    if not exists(merkle) or getmtime(merkle) < getmtime(manifest):
+        return None, {}
+    with open_manifest(merkle) as f:
+        return load_merkle(f)
+
+
+def main(args=None):
+    arg = p.parse_intermixed_args(args)
+    method = arg.method
+    skip = None
+    method_a, dirs_a = load_dirs(arg.old, arg.file)
+    method_b, dirs_b = load_dirs(arg.new, arg.file)
+    if method_a is not None and method_a == method_b \
+            and method in ['auto', method_a]:
+        # Both sides have directory digests, files in directories which are
+        # the same on both sides are not loaded at all.
+        if dirs_a.get('.') == dirs_b.get('.'):
+            print("No changes.")
+            return True
+        method = method_a
+        skip = {k for k, v in dirs_a.items() if dirs_b.get(k) == v}
+    method, a = load(arg.old, arg.file, method, skip)
+    # Compare the new manifest with the method of the old one.
+    method_b, b = load(arg.new, arg.file, method or arg.method, skip)
+    method = method or method_b or 'md5'
+    count = 0
+    for change, path in diff_merkle(merkle_tree(a, method),
+                                    merkle_tree(b, method)):
+        print(f"{change} {path}")
+        count += 1
+    if count:
+        print(f"Total: {count} changes.")
+    else:
+        print("No changes.")
+    return count == 0
+
+
+if __name__ == '__main__':
+    # The exit status is 1 if there are changes, like diff.
+    exit(0 if main() else 1)
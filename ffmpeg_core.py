@@ -1,6 +1,8 @@
 from ctypes import (
     CDLL,
+    CFUNCTYPE,
     POINTER,
+    byref,
     c_char_p,
     c_float,
     c_int,
@@ -9,13 +11,32 @@ from ctypes import (
     c_size_t,
     c_void_p,
     c_wchar_p,
+    create_string_buffer,
     pointer,
 )
-from ctypes.util import find_library
+from collections import deque
 from os.path import exists
-from typing import List
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Union,
+)
 from platform import system
-from os import environ
+from os import environ, fsencode
+from threading import (
+    Event,
+    Lock,
+    RLock,
+    Thread,
+    Timer,
+    current_thread,
+    local,
+)
 
 
 if system() == 'Windows':
@@ -24,187 +45,173 @@ if system() == 'Windows':
 else:
     char_type = c_char_p
     isWindows = False
-if exists('ffmpeg_core.dll'):
-    dll = 'ffmpeg_core.dll'
-elif exists('ffmpeg_core.so'):
-    dll = './ffmpeg_core.so'
-elif environ.get("FFMPEG_CORE"):
-    dll = environ.get("FFMPEG_CORE")
-else:
+# void callback(void *avcl, int level, const char *fmt, va_list vl)
+LOG_CALLBACK = CFUNCTYPE(None, c_void_p, c_int, c_void_p, c_void_p)
+# name -> (restype, argtypes[, the minimal version of the library])
+_SIGNATURES = {
+    'free_music_handle': (None, [c_void_p]),
+    'free_music_info_handle': (None, [c_void_p]),
+    'free_ffmpeg_core_settings': (None, [c_void_p]),
+    'free_device_name_list': (None, [c_void_p]),
+    'ffmpeg_core_free': (None, [c_void_p]),
+    'ffmpeg_core_malloc': (c_void_p, [c_size_t]),
+    'ffmpeg_core_realloc': (c_void_p, [c_void_p, c_size_t]),
+    'ffmpeg_core_log_format_line': (c_int, [c_void_p, c_int, c_void_p, c_void_p, c_char_p, c_int, POINTER(c_int)]),  # noqa: E501
+    'ffmpeg_core_log_set_callback': (None, [LOG_CALLBACK]),
+    'ffmpeg_core_log_set_flags': (None, [c_int]),
+    'ffmpeg_core_version_str': (c_char_p, []),
+    'ffmpeg_core_version': (c_int32, []),
+    'ffmpeg_core_dump_library_version': (None, [c_int, c_int]),
+    'ffmpeg_core_dump_ffmpeg_configuration': (None, [c_int, c_int]),
+    'ffmpeg_core_open': (c_int, [char_type, POINTER(c_void_p)]),
+    'ffmpeg_core_open2': (c_int, [char_type, POINTER(c_void_p), c_void_p]),
+    'ffmpeg_core_open3': (c_int, [char_type, POINTER(c_void_p), c_void_p, char_type]),  # noqa: E501
+    'ffmpeg_core_info_open': (c_int, [char_type, POINTER(c_void_p)]),
+    'ffmpeg_core_play': (c_int, [c_void_p]),
+    'ffmpeg_core_pause': (c_int, [c_void_p]),
+    'ffmpeg_core_seek': (c_int, [c_void_p, c_int64]),
+    'ffmpeg_core_set_volume': (c_int, [c_void_p, c_int]),
+    'ffmpeg_core_set_speed': (c_int, [c_void_p, c_float]),
+    'ffmpeg_core_set_equalizer_channel': (c_int, [c_void_p, c_int, c_int]),
+    'ffmpeg_core_get_error': (c_int, [c_void_p]),
+    'ffmpeg_core_get_err_msg': (c_void_p, [c_int]),
+    'ffmpeg_core_get_err_msg2': (char_type, [c_int]),
+    'ffmpeg_core_get_cur_position': (c_int64, [c_void_p]),
+    'ffmpeg_core_song_is_over': (c_int, [c_void_p]),
+    'ffmpeg_core_get_song_length': (c_int64, [c_void_p]),
+    'ffmpeg_core_info_get_song_length': (c_int64, [c_void_p]),
+    'ffmpeg_core_get_channels': (c_int, [c_void_p]),
+    'ffmpeg_core_info_get_channels': (c_int, [c_void_p]),
+    'ffmpeg_core_get_freq': (c_int, [c_void_p]),
+    'ffmpeg_core_info_get_freq': (c_int, [c_void_p]),
+    'ffmpeg_core_is_playing': (c_int, [c_void_p]),
+    'ffmpeg_core_get_bits': (c_int, [c_void_p]),
+    'ffmpeg_core_info_get_bits': (c_int, [c_void_p]),
+    'ffmpeg_core_get_bitrate': (c_int, [c_void_p]),
+    'ffmpeg_core_info_get_bitrate': (c_int, [c_void_p]),
+    'ffmpeg_core_get_metadata': (c_void_p, [c_void_p, c_char_p]),
+    'ffmpeg_core_info_get_metadata': (c_void_p, [c_void_p, c_char_p]),
+    'ffmpeg_core_init_settings': (c_void_p, []),
+    'ffmpeg_core_is_wasapi_supported': (c_int, [], [1, 0, 0, 1]),
+    'ffmpeg_core_settings_set_use_WASAPI': (c_int, [c_void_p, c_int], [1, 0, 0, 1]),  # noqa: E501
+    'ffmpeg_core_settings_set_enable_exclusive': (c_int, [c_void_p, c_int], [1, 0, 0, 1]),  # noqa: E501
+    'ffmpeg_core_settings_set_max_wait_time': (c_int, [c_void_p, c_int], [1, 0, 0, 1]),  # noqa: E501
+    'ffmpeg_core_settings_set_wasapi_min_buffer_time': (c_int, [c_void_p, c_int], [1, 0, 0, 2]),  # noqa: E501
+    'ffmpeg_core_set_reverb': (c_int, [c_void_p, c_int, c_float, c_float], [1, 0, 0, 2]),  # noqa: E501
+    'ffmpeg_core_settings_set_max_wait_buffer_time': (c_int, [c_void_p, c_int], [1, 1, 1, 0]),  # noqa: E501
+}
+
+
+def find_dll() -> str:
+    if exists('ffmpeg_core.dll'):
+        return 'ffmpeg_core.dll'
+    elif exists('ffmpeg_core.so'):
+        return './ffmpeg_core.so'
+    elif environ.get("FFMPEG_CORE"):
+        return environ.get("FFMPEG_CORE")
+    # ctypes.util is slow to import, it is only needed here.
+    from ctypes.util import find_library
     dll = find_library('ffmpeg_core') or find_library('_ffmpeg_core')
     if dll is None:
         if isWindows:
             dll = 'ffmpeg_core.dll'
         else:
             dll = 'ffmpeg_core.so'
-dll = CDLL(dll)
-free_music_handle = dll.free_music_handle
-free_music_handle.restype = None
-free_music_handle.argtypes = [c_void_p]
-free_music_info_handle = dll.free_music_info_handle
-free_music_info_handle.restype = None
-free_music_info_handle.argtypes = [c_void_p]
-free_ffmpeg_core_settings = dll.free_ffmpeg_core_settings
-free_ffmpeg_core_settings.restype = None
-free_ffmpeg_core_settings.argtypes = [c_void_p]
-free_device_name_list = dll.free_device_name_list
-free_device_name_list.restype = None
-free_device_name_list.argtypes = [c_void_p]
-ffmpeg_core_free = dll.ffmpeg_core_free
-ffmpeg_core_free.restype = None
-ffmpeg_core_free.argtypes = [c_void_p]
-ffmpeg_core_malloc = dll.ffmpeg_core_malloc
-ffmpeg_core_malloc.restype = c_void_p
-ffmpeg_core_malloc.argtypes = [c_size_t]
-ffmpeg_core_realloc = dll.ffmpeg_core_realloc
-ffmpeg_core_realloc.restype = c_void_p
-ffmpeg_core_realloc.argtypes = [c_void_p, c_size_t]
-ffmpeg_core_log_format_line = dll.ffmpeg_core_log_format_line
-ffmpeg_core_log_format_line.restype = c_int
-ffmpeg_core_log_set_callback = dll.ffmpeg_core_log_set_callback
-ffmpeg_core_log_set_callback.restype = None
-ffmpeg_core_log_set_flags = dll.ffmpeg_core_log_set_flags
-ffmpeg_core_log_set_flags.restype = None
-ffmpeg_core_log_set_flags.argtypes = [c_int]
-ffmpeg_core_version_str = dll.ffmpeg_core_version_str
-ffmpeg_core_version_str.restype = c_char_p
-ffmpeg_core_version_str.argtypes = []
-ffmpeg_core_version = dll.ffmpeg_core_version
-ffmpeg_core_version.restype = c_int32
-ffmpeg_core_version.argtypes = []
-ffmpeg_core_dump_library_version = dll.ffmpeg_core_dump_library_version
-ffmpeg_core_dump_library_version.restype = None
-ffmpeg_core_dump_library_version.argtypes = [c_int, c_int]
-ffmpeg_core_dump_ffmpeg_configuration = dll.ffmpeg_core_dump_ffmpeg_configuration  # noqa: E501
-ffmpeg_core_dump_ffmpeg_configuration.restype = None
-ffmpeg_core_dump_ffmpeg_configuration.argtypes = [c_int, c_int]
-ffmpeg_core_open = dll.ffmpeg_core_open
-ffmpeg_core_open.restype = c_int
-ffmpeg_core_open.argtypes = [char_type, POINTER(c_void_p)]
-ffmpeg_core_open2 = dll.ffmpeg_core_open2
-ffmpeg_core_open2.restype = c_int
-ffmpeg_core_open2.argtypes = [char_type, POINTER(c_void_p), c_void_p]
-ffmpeg_core_open3 = dll.ffmpeg_core_open3
-ffmpeg_core_open3.restype = c_int
-ffmpeg_core_open3.argtypes = [char_type, POINTER(c_void_p), c_void_p, char_type]  # noqa: E501
-ffmpeg_core_info_open = dll.ffmpeg_core_info_open
-ffmpeg_core_info_open.restype = c_int
-ffmpeg_core_info_open.argtypes = [char_type, POINTER(c_void_p)]
-ffmpeg_core_play = dll.ffmpeg_core_play
-ffmpeg_core_play.restype = c_int
-ffmpeg_core_play.argtypes = [c_void_p]
-ffmpeg_core_pause = dll.ffmpeg_core_pause
-ffmpeg_core_pause.restype = c_int
-ffmpeg_core_pause.argtypes = [c_void_p]
-ffmpeg_core_seek = dll.ffmpeg_core_seek
-ffmpeg_core_seek.restype = c_int
-ffmpeg_core_seek.argtypes = [c_void_p, c_int64]
-ffmpeg_core_set_volume = dll.ffmpeg_core_set_volume
-ffmpeg_core_set_volume.restype = c_int
-ffmpeg_core_set_volume.argtypes = [c_void_p, c_int]
-ffmpeg_core_set_speed = dll.ffmpeg_core_set_speed
-ffmpeg_core_set_speed.restype = c_int
-ffmpeg_core_set_speed.argtypes = [c_void_p, c_float]
-ffmpeg_core_set_equalizer_channel = dll.ffmpeg_core_set_equalizer_channel
-ffmpeg_core_set_equalizer_channel.restype = c_int
-ffmpeg_core_set_equalizer_channel.argtypes = [c_void_p, c_int, c_int]
-ffmpeg_core_get_error = dll.ffmpeg_core_get_error
-ffmpeg_core_get_error.restype = c_int
-ffmpeg_core_get_error.argtypes = [c_void_p]
-ffmpeg_core_get_err_msg = dll.ffmpeg_core_get_err_msg
-ffmpeg_core_get_err_msg.restype = c_void_p
-ffmpeg_core_get_err_msg.argtypes = [c_int]
-ffmpeg_core_get_err_msg2 = dll.ffmpeg_core_get_err_msg2
-ffmpeg_core_get_err_msg2.restype = char_type
-ffmpeg_core_get_err_msg2.argtypes = [c_int]
-ffmpeg_core_get_cur_position = dll.ffmpeg_core_get_cur_position
-ffmpeg_core_get_cur_position.restype = c_int64
-ffmpeg_core_get_cur_position.argtypes = [c_void_p]
-ffmpeg_core_song_is_over = dll.ffmpeg_core_song_is_over
-ffmpeg_core_song_is_over.restype = c_int
-ffmpeg_core_song_is_over.argtypes = [c_void_p]
-ffmpeg_core_get_song_length = dll.ffmpeg_core_get_song_length
-ffmpeg_core_get_song_length.restype = c_int64
-ffmpeg_core_get_song_length.argtypes = [c_void_p]
-ffmpeg_core_info_get_song_length = dll.ffmpeg_core_info_get_song_length
-ffmpeg_core_info_get_song_length.restype = c_int64
-ffmpeg_core_info_get_song_length.argtypes = [c_void_p]
-ffmpeg_core_get_channels = dll.ffmpeg_core_get_channels
-ffmpeg_core_get_channels.restype = c_int
-ffmpeg_core_get_channels.argtypes = [c_void_p]
-ffmpeg_core_info_get_channels = dll.ffmpeg_core_info_get_channels
-ffmpeg_core_info_get_channels.restype = c_int
-ffmpeg_core_info_get_channels.argtypes = [c_void_p]
-ffmpeg_core_get_freq = dll.ffmpeg_core_get_freq
-ffmpeg_core_get_freq.restype = c_int
-ffmpeg_core_get_freq.argtypes = [c_void_p]
-ffmpeg_core_info_get_freq = dll.ffmpeg_core_info_get_freq
-ffmpeg_core_info_get_freq.restype = c_int
-ffmpeg_core_info_get_freq.argtypes = [c_void_p]
-ffmpeg_core_is_playing = dll.ffmpeg_core_is_playing
-ffmpeg_core_is_playing.restype = c_int
-ffmpeg_core_is_playing.argtypes = [c_void_p]
-ffmpeg_core_get_bits = dll.ffmpeg_core_get_bits
-ffmpeg_core_get_bits.restype = c_int
-ffmpeg_core_get_bits.argtypes = [c_void_p]
-ffmpeg_core_info_get_bits = dll.ffmpeg_core_info_get_bits
-ffmpeg_core_info_get_bits.restype = c_int
-ffmpeg_core_info_get_bits.argtypes = [c_void_p]
-ffmpeg_core_get_bitrate = dll.ffmpeg_core_get_bitrate
-ffmpeg_core_get_bitrate.restype = c_int
-ffmpeg_core_get_bitrate.argtypes = [c_void_p]
-ffmpeg_core_info_get_bitrate = dll.ffmpeg_core_info_get_bitrate
-ffmpeg_core_info_get_bitrate.restype = c_int
-ffmpeg_core_info_get_bitrate.argtypes = [c_void_p]
-ffmpeg_core_get_metadata = dll.ffmpeg_core_get_metadata
-ffmpeg_core_get_metadata.restype = c_void_p
-ffmpeg_core_get_metadata.argtypes = [c_void_p, c_char_p]
-ffmpeg_core_info_get_metadata = dll.ffmpeg_core_info_get_metadata
-ffmpeg_core_info_get_metadata.restype = c_void_p
-ffmpeg_core_info_get_metadata.argtypes = [c_void_p, c_char_p]
-ffmpeg_core_init_settings = dll.ffmpeg_core_init_settings
-ffmpeg_core_init_settings.restype = c_void_p
-ffmpeg_core_init_settings.argtypes = []
-version: int = ffmpeg_core_version()
-version: List[int] = [i for i in version.to_bytes(4, 'big')]
-if version >= [1, 0, 0, 1]:
-    ffmpeg_core_is_wasapi_supported = dll.ffmpeg_core_is_wasapi_supported
-    ffmpeg_core_is_wasapi_supported.restype = c_int
-    ffmpeg_core_is_wasapi_supported.argtypes = []
-    ffmpeg_core_settings_set_use_WASAPI = dll.ffmpeg_core_settings_set_use_WASAPI  # noqa: E501
-    ffmpeg_core_settings_set_use_WASAPI.restype = c_int
-    ffmpeg_core_settings_set_use_WASAPI.argtypes = [c_void_p, c_int]
-    ffmpeg_core_settings_set_enable_exclusive = dll.ffmpeg_core_settings_set_enable_exclusive  # noqa: E501
-    ffmpeg_core_settings_set_enable_exclusive.restype = c_int
-    ffmpeg_core_settings_set_enable_exclusive.argtypes = [c_void_p, c_int]
-    ffmpeg_core_settings_set_max_wait_time = dll.ffmpeg_core_settings_set_max_wait_time  # noqa: E501
-    ffmpeg_core_settings_set_max_wait_time.restype = c_int
-    ffmpeg_core_settings_set_max_wait_time.argtypes = [c_void_p, c_int]
-if version >= [1, 0, 0, 2]:
-    ffmpeg_core_settings_set_wasapi_min_buffer_time = dll.ffmpeg_core_settings_set_wasapi_min_buffer_time  # noqa: E501
-    ffmpeg_core_settings_set_wasapi_min_buffer_time.restype = c_int
-    ffmpeg_core_settings_set_wasapi_min_buffer_time.argtypes = [c_void_p, c_int]  # noqa: E501
-    ffmpeg_core_set_reverb = dll.ffmpeg_core_set_reverb
-    ffmpeg_core_set_reverb.restype = c_int
-    ffmpeg_core_set_reverb.argtypes = [c_void_p, c_int, c_float, c_float]
-if version >= [1, 1, 1, 0]:
-    ffmpeg_core_settings_set_max_wait_buffer_time = dll.ffmpeg_core_settings_set_max_wait_buffer_time  # noqa: E501
-    ffmpeg_core_settings_set_max_wait_buffer_time.restype = c_int
-    ffmpeg_core_settings_set_max_wait_buffer_time.argtypes = [c_void_p, c_int]  # noqa: E501
+    return dll
+
+
+def load_backend():
+    # FFMPEG_CORE_BACKEND=mock uses ffmpeg_core_mock instead of the real
+    # library, e.g. for tests and benchmarks.
+    if environ.get("FFMPEG_CORE_BACKEND") == 'mock':
+        from ffmpeg_core_mock import MockBackend
+        return MockBackend()
+    return CDLL(find_dll())
+
+
+class _Library:
+    # The library is loaded on first use, and every function is bound and
+    # typed the first time it is used, so importing this module is cheap and
+    # does not fail if the library is missing. Any object which has the
+    # functions of the library as attributes can be used as the backend,
+    # only functions of a CDLL are typed.
+    def __init__(self):
+        self._dll = None
+        self._lock = Lock()
+        self._version = None
+
+    @property
+    def dll(self):
+        if self._dll is None:
+            with self._lock:
+                if self._dll is None:
+                    self._dll = load_backend()
+        return self._dll
+
+    def set_backend(self, backend):
+        # None loads the default backend again on next use. Handles which
+        # are opened with the old backend must not be used after this.
+        with self._lock:
+            for name in _SIGNATURES:
+                self.__dict__.pop(name, None)
+            self._dll = backend
+            self._version = None
+
+    @property
+    def version(self) -> List[int]:
+        if self._version is None:
+            v: int = self.ffmpeg_core_version()
+            self._version = [i for i in v.to_bytes(4, 'big')]
+        return self._version
+
+    def __getattr__(self, name: str):
+        try:
+            sig = _SIGNATURES[name]
+        except KeyError:
+            raise AttributeError(name)
+        if len(sig) > 2 and self.version < sig[2]:
+            raise AttributeError(f"{name} needs ffmpeg_core {'.'.join(str(i) for i in sig[2])} or higher.")  # noqa: E501
+        dll = self.dll
+        f = getattr(dll, name)
+        if isinstance(dll, CDLL):
+            f.restype = sig[0]
+            if sig[1] is not None:
+                f.argtypes = sig[1]
+        setattr(self, name, f)
+        return f
+
+
+lib = _Library()
+
+
+def set_backend(backend):
+    lib.set_backend(backend)
+
+
+def __getattr__(name: str):
+    # Keeps the old module level names like ffmpeg_core_version working.
+    if name == 'dll':
+        return lib.dll
+    if name == 'version':
+        return lib.version
+    try:
+        return getattr(lib, name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class FFMPEGCoreError(Exception):
     def __init__(self, err: int) -> None:
         self.err = err
-        t = ffmpeg_core_get_err_msg(err)
+        t = lib.ffmpeg_core_get_err_msg(err)
         if t is None:
             if err < 0:
                 self.msg = "OOM When getting error message"
             else:
-                self.msg = ffmpeg_core_get_err_msg2(err)
+                self.msg = lib.ffmpeg_core_get_err_msg2(err)
         else:
             self.msg = char_type(t).value
-            ffmpeg_core_free(t)
+            lib.ffmpeg_core_free(t)
         Exception.__init__(self, f"{self.err} {self.msg}")
 
 
@@ -213,56 +220,114 @@ class FFMPEGHigherVersionNeededError(Exception):
 
 
 class FFMPEGCoreSettings:
+    __slots__ = ('_h',)
+
     def __init__(self):
-        self._h = ffmpeg_core_init_settings()
+        self._h = lib.ffmpeg_core_init_settings()
 
     def __del__(self):
+        self.close()
+
+    def close(self):
         if self._h:
-            free_ffmpeg_core_settings(self._h)
+            lib.free_ffmpeg_core_settings(self._h)
             self._h = None
 
     def set_use_WASAPI(self, enable: bool):
-        if version >= [1, 0, 0, 1] and ffmpeg_core_is_wasapi_supported():
-            return not ffmpeg_core_settings_set_use_WASAPI(self._h, 1 if enable else 0)  # noqa: E501
+        if lib.version >= [1, 0, 0, 1] and lib.ffmpeg_core_is_wasapi_supported():  # noqa: E501
+            return not lib.ffmpeg_core_settings_set_use_WASAPI(self._h, 1 if enable else 0)  # noqa: E501
         else:
             raise Exception('WASAPI is not supported')
 
     def set_enable_exclusive(self, enable: bool):
-        if version >= [1, 0, 0, 1] and ffmpeg_core_is_wasapi_supported():
-            return not ffmpeg_core_settings_set_enable_exclusive(self._h, 1 if enable else 0)  # noqa: E501
+        if lib.version >= [1, 0, 0, 1] and lib.ffmpeg_core_is_wasapi_supported():  # noqa: E501
+            return not lib.ffmpeg_core_settings_set_enable_exclusive(self._h, 1 if enable else 0)  # noqa: E501
         else:
             raise Exception('WASAPI is not supported')
 
     def set_max_wait_time(self, time: int):
-        if version >= [1, 0, 0, 1]:
-            return not ffmpeg_core_settings_set_max_wait_time(self._h, time)
+        if lib.version >= [1, 0, 0, 1]:
+            return not lib.ffmpeg_core_settings_set_max_wait_time(self._h, time)  # noqa: E501
         else:
             raise FFMPEGHigherVersionNeededError
 
     def set_wasapi_min_buffer_time(self, time: int):
-        if version >= [1, 0, 0, 2] or ffmpeg_core_is_wasapi_supported():
-            return not ffmpeg_core_settings_set_wasapi_min_buffer_time(self._h, time)  # noqa: E501
+        if lib.version >= [1, 0, 0, 2] or lib.ffmpeg_core_is_wasapi_supported():  # noqa: E501
+            return not lib.ffmpeg_core_settings_set_wasapi_min_buffer_time(self._h, time)  # noqa: E501
         else:
             raise Exception('WASAPI is not supported')
 
     def set_max_wait_buffer_time(self, time: int):
-        if version >= [1, 1, 1, 0]:
-            return not ffmpeg_core_settings_set_max_wait_buffer_time(self._h, time)
+        if lib.version >= [1, 1, 1, 0]:
+            return not lib.ffmpeg_core_settings_set_max_wait_buffer_time(self._h, time)  # noqa: E501
         else:
             raise FFMPEGHigherVersionNeededError
 
 
-class FFMPEGCore:
+# Tags returned by metadata() by default.
+COMMON_TAGS = ('title', 'artist', 'album', 'album_artist', 'composer',
+               'genre', 'date', 'track', 'disc', 'comment', 'lyrics',
+               'copyright', 'performer', 'publisher', 'language', 'encoder')
+
+
+class _Metadata:
+    # The library can only read one tag per call, and every call allocates
+    # the returned string. Tags of a file do not change, so every tag is
+    # only read once and kept in _metadata.
+    __slots__ = ()
+
+    @property
+    def album(self):
+        return self['album']
+
+    @property
+    def artist(self):
+        return self['artist']
+
+    def metadata(self, keys: Iterable[str] = COMMON_TAGS) -> Dict[str, Union[str, bytes]]:  # noqa: E501
+        # Tags which are not present are not included.
+        r = {}
+        for k in keys:
+            v = self[k]
+            if v is not None:
+                r[k] = v
+        return r
+
+    @property
+    def title(self):
+        return self['title']
+
+    def __getitem__(self, k):
+        if not isinstance(k, (str, bytes)):
+            raise TypeError("key must be str or bytes")
+        if isinstance(k, str):
+            k = k.encode()
+        if k in self._metadata:
+            return self._metadata[k]
+        if self._opened:
+            h = self._read_metadata(k)
+            t = None
+            if h:
+                t = char_type(h).value
+                lib.ffmpeg_core_free(h)
+            self._metadata[k] = t
+            return t
+
+
+class FFMPEGCore(_Metadata):
+    __slots__ = ('_fn', '_h', '_opened', '_metadata', '_volume', '_speed')
+
     def __init__(self, fn: str, settings: FFMPEGCoreSettings = None):
         self._fn = fn
         self._h = c_void_p()
         self._opened = False
+        self._metadata = {}
         if not isWindows:
-            fn = fn.encode()
+            fn = fsencode(fn)
         if settings is None:
-            r = ffmpeg_core_open(fn, pointer(self._h))
+            r = lib.ffmpeg_core_open(fn, pointer(self._h))
         else:
-            r = ffmpeg_core_open2(fn, pointer(self._h), settings._h)
+            r = lib.ffmpeg_core_open2(fn, pointer(self._h), settings._h)
         if r == 0:
             self._opened = True
         else:
@@ -270,70 +335,69 @@ class FFMPEGCore:
         self._volume = 100
         self._speed = 1.0
 
-    @property
-    def album(self):
-        return self['album']
-
-    @property
-    def artist(self):
-        return self['artist']
-
     @property
     def bits(self) -> int:
         if self._opened:
-            return ffmpeg_core_get_bits(self._h)
+            return lib.ffmpeg_core_get_bits(self._h)
 
     @property
     def bitrate(self) -> int:
         if self._opened:
-            return ffmpeg_core_get_bitrate(self._h)
+            return lib.ffmpeg_core_get_bitrate(self._h)
 
     @property
     def channels(self) -> int:
         if self._opened:
-            return ffmpeg_core_get_channels(self._h)
+            return lib.ffmpeg_core_get_channels(self._h)
 
     def clear_reverb(self):
         self.set_reverb(0, 0.0, 0.0)
 
     def close(self):
         if self._opened:
-            free_music_handle(self._h)
+            lib.free_music_handle(self._h)
             self._opened = False
             self._h = None
 
+    @property
+    def error(self) -> Optional[FFMPEGCoreError]:
+        if self._opened:
+            r = lib.ffmpeg_core_get_error(self._h)
+            if r:
+                return FFMPEGCoreError(r)
+
     @property
     def freq(self) -> int:
         if self._opened:
-            return ffmpeg_core_get_freq(self._h)
+            return lib.ffmpeg_core_get_freq(self._h)
 
     @property
     def is_over(self) -> bool:
         if self._opened:
-            return True if ffmpeg_core_song_is_over(self._h) else False
+            return True if lib.ffmpeg_core_song_is_over(self._h) else False
 
     @property
     def length(self) -> float:
         if self._opened:
-            return ffmpeg_core_get_song_length(self._h) / 1E6
+            return lib.ffmpeg_core_get_song_length(self._h) / 1E6
 
     def pause(self):
         if self._opened:
-            ffmpeg_core_pause(self._h)
+            lib.ffmpeg_core_pause(self._h)
 
     def play(self):
         if self._opened:
-            ffmpeg_core_play(self._h)
+            lib.ffmpeg_core_play(self._h)
 
     @property
     def playing(self):
         if self._opened:
-            return True if ffmpeg_core_is_playing(self._h) else False
+            return True if lib.ffmpeg_core_is_playing(self._h) else False
 
     @property
     def position(self) -> float:
         if self._opened:
-            return ffmpeg_core_get_cur_position(self._h) / 1E6
+            return lib.ffmpeg_core_get_cur_position(self._h) / 1E6
 
     @position.setter
     def position(self, value: float):
@@ -342,13 +406,13 @@ class FFMPEGCore:
     def seek(self, pos: float):
         pos = int(pos * 1E6)
         if self._opened:
-            r = ffmpeg_core_seek(self._h, pos)
+            r = lib.ffmpeg_core_seek(self._h, pos)
             if r:
                 raise FFMPEGCoreError(r)
 
     def set_reverb(self, type: int, mix: float, time: float):
         if self._opened:
-            r = ffmpeg_core_set_reverb(self._h, type, mix, time)
+            r = lib.ffmpeg_core_set_reverb(self._h, type, mix, time)
             if r:
                 raise FFMPEGCoreError(r)
 
@@ -361,16 +425,12 @@ class FFMPEGCore:
         if not isinstance(v, (int, float)):
             raise TypeError("speed must be int or float")
         v = float(v)
-        r = ffmpeg_core_set_speed(self._h, v)
+        r = lib.ffmpeg_core_set_speed(self._h, v)
         if r == 0:
             self._speed = v
         else:
             raise FFMPEGCoreError(r)
 
-    @property
-    def title(self):
-        return self['title']
-
     @property
     def volume(self) -> int:
         return self._volume
@@ -379,7 +439,7 @@ class FFMPEGCore:
     def volume(self, v):
         if not isinstance(v, int):
             raise TypeError("volume must be an integer")
-        r = ffmpeg_core_set_volume(self._h, v)
+        r = lib.ffmpeg_core_set_volume(self._h, v)
         if not r:
             self._volume = v
         else:
@@ -387,17 +447,610 @@ class FFMPEGCore:
 
     def __del__(self):
         if self._opened:
-            free_music_handle(self._h)
+            lib.free_music_handle(self._h)
             self._h = None
 
-    def __getitem__(self, k):
-        if not isinstance(k, (str, bytes)):
-            raise TypeError("key must be str or bytes")
-        if isinstance(k, str):
-            k = k.encode()
+    def _read_metadata(self, k: bytes):
+        return lib.ffmpeg_core_get_metadata(self._h, k)
+
+
+class FFMPEGCoreInfo(_Metadata):
+    # Only reads the information of a file, no audio output is opened.
+    __slots__ = ('_fn', '_h', '_opened', '_metadata')
+
+    def __init__(self, fn: str):
+        self._fn = fn
+        self._h = c_void_p()
+        self._opened = False
+        self._metadata = {}
+        if not isWindows:
+            fn = fsencode(fn)
+        r = lib.ffmpeg_core_info_open(fn, pointer(self._h))
+        if r == 0:
+            self._opened = True
+        else:
+            raise FFMPEGCoreError(r)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def bits(self) -> int:
         if self._opened:
-            h = ffmpeg_core_get_metadata(self._h, k)
-            if h:
-                t = char_type(h).value
-                ffmpeg_core_free(h)
-                return t
+            return lib.ffmpeg_core_info_get_bits(self._h)
+
+    @property
+    def bitrate(self) -> int:
+        if self._opened:
+            return lib.ffmpeg_core_info_get_bitrate(self._h)
+
+    @property
+    def channels(self) -> int:
+        if self._opened:
+            return lib.ffmpeg_core_info_get_channels(self._h)
+
+    def close(self):
+        if self._opened:
+            lib.free_music_info_handle(self._h)
+            self._opened = False
+            self._h = None
+
+    @property
+    def freq(self) -> int:
+        if self._opened:
+            return lib.ffmpeg_core_info_get_freq(self._h)
+
+    @property
+    def length(self) -> float:
+        if self._opened:
+            return lib.ffmpeg_core_info_get_song_length(self._h) / 1E6
+
+    def __del__(self):
+        if self._opened:
+            lib.free_music_info_handle(self._h)
+            self._h = None
+
+    def _read_metadata(self, k: bytes):
+        return lib.ffmpeg_core_info_get_metadata(self._h, k)
+
+
+class MusicInfo(NamedTuple):
+    path: str
+    length: Optional[float] = None
+    channels: Optional[int] = None
+    freq: Optional[int] = None
+    bits: Optional[int] = None
+    bitrate: Optional[int] = None
+    # Tag name -> value, missing tags are not included.
+    tags: Optional[dict] = None
+    error: Optional[Exception] = None
+
+
+DEFAULT_TAGS = ('title', 'artist', 'album')
+
+
+def probe(fn: str, tags: Sequence[str] = DEFAULT_TAGS) -> MusicInfo:
+    try:
+        with FFMPEGCoreInfo(fn) as i:
+            t = {k: v.decode(errors='replace') if isinstance(v, bytes) else v
+                 for k, v in i.metadata(tags).items()}
+            return MusicInfo(fn, i.length, i.channels, i.freq, i.bits,
+                             i.bitrate, t)
+    except Exception as e:
+        return MusicInfo(fn, error=e)
+
+
+def probe_many(paths: Iterable[str], workers: int = 4,
+               tags: Sequence[str] = DEFAULT_TAGS) -> List[MusicInfo]:
+    # ctypes releases the GIL while calling into the library, so files are
+    # probed in parallel on threads. Results are in the order of paths,
+    # files which can not be opened have error set.
+    if workers <= 1:
+        return [probe(fn, tags) for fn in paths]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(workers) as ex:
+        return list(ex.map(lambda fn: probe(fn, tags), paths))
+
+
+PLAYING = 'playing'
+PAUSED = 'paused'
+POSITION = 'position'
+ENDED = 'ended'
+ERROR = 'error'
+# Sent by Player when it starts a track.
+TRACK = 'track'
+# Sent by Player when there is no track left to play.
+FINISHED = 'finished'
+
+
+class PlaybackEvent(NamedTuple):
+    type: str
+    position: Optional[float] = None
+    error: Optional[FFMPEGCoreError] = None
+
+
+def _call_callback(callback: Callable[[PlaybackEvent], None],
+                   ev: PlaybackEvent):
+    # Errors of the callback are logged, so they do not end the delivery
+    # of the following events.
+    try:
+        callback(ev)
+    except Exception:
+        import logging
+        logging.getLogger('ffmpeg_core').exception(
+            'Error in the callback of %s event', ev.type)
+
+
+class PlaybackWatcher:
+    # The library has no callbacks for the playback state, so one background
+    # thread polls the handle every interval seconds and turns changes into
+    # events. Events are passed to callback (on the watcher thread) and/or
+    # put into queue, an asyncio.Queue of the loop which is running when the
+    # watcher is created. Set core to None or stop the watcher before
+    # closing the handle.
+    def __init__(self, core: Optional[FFMPEGCore] = None,
+                 interval: float = 0.5,
+                 callback: Optional[Callable[[PlaybackEvent], None]] = None,
+                 queue=None):
+        self.interval = interval
+        self._callback = callback
+        self._queue = queue
+        if queue is not None:
+            import asyncio
+            self._loop = asyncio.get_running_loop()
+        # Reentrant, so callbacks can swap the handle.
+        self._lock = RLock()
+        self._stop = Event()
+        self._thread = None
+        self.core = core
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def core(self) -> Optional[FFMPEGCore]:
+        return self._core
+
+    @core.setter
+    def core(self, core: Optional[FFMPEGCore]):
+        # Waits until the current poll is done, so the old handle can be
+        # closed after this.
+        with self._lock:
+            self._core = core
+            self._playing = False
+            self._position = None
+            self._ended = False
+            self._error = 0
+
+    def start(self):
+        if self._thread is None:
+            # Every thread has its own stop event, so a thread which was
+            # stopped without waiting can not be revived by start().
+            self._stop = Event()
+            self._thread = Thread(target=self._run, args=(self._stop,),
+                                  daemon=True)
+            self._thread.start()
+
+    def stop(self, wait: bool = True):
+        # Use wait=False while holding the lock, the thread then exits after
+        # the current poll. It is never joined from its own callbacks.
+        if self._thread is not None:
+            self._stop.set()
+            if wait and self._thread is not current_thread():
+                self._thread.join()
+            self._thread = None
+
+    def _emit(self, ev: PlaybackEvent):
+        if self._callback is not None:
+            _call_callback(self._callback, ev)
+        if self._queue is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._queue.put_nowait, ev)
+            except RuntimeError:
+                # The loop is closed, so nothing can receive events any more.
+                import logging
+                logging.getLogger('ffmpeg_core').warning(
+                    'Event loop is closed, stop watching the playback')
+                self._queue = None
+                self.stop(wait=False)
+
+    def _poll(self):
+        core = self._core
+        if core is None:
+            return
+        error = core.error
+        if error is not None and error.err != self._error:
+            self._error = error.err
+            self._emit(PlaybackEvent(ERROR, error=error))
+        playing = bool(core.playing)
+        position = core.position
+        over = core.is_over
+        if playing != self._playing:
+            self._playing = playing
+            # Playback also stops at the end, which is reported as ended.
+            if playing or not over:
+                self._emit(PlaybackEvent(PLAYING if playing else PAUSED,
+                                         position))
+        if playing and position != self._position:
+            self._position = position
+            self._emit(PlaybackEvent(POSITION, position))
+        if not self._ended and over:
+            self._ended = True
+            self._emit(PlaybackEvent(ENDED, position))
+
+    def _run(self, stop: Event):
+        while not stop.is_set():
+            with self._lock:
+                self._poll()
+            stop.wait(self.interval)
+
+
+class Player:
+    # Plays the files in playlist one after another. In the last preload
+    # seconds of a track the next one is opened and seeked to its start on
+    # a background thread, and it is started when the current one ends, so
+    # there is no gap for opening and probing it. All handles share one
+    # FFMPEGCoreSettings and are closed as soon as they are not used. Events
+    # of the playing handle, TRACK events and a FINISHED event at the end of
+    # the playlist are passed to callback and/or queue, like PlaybackWatcher.
+    def __init__(self, files: Iterable[str] = (),
+                 settings: Optional[FFMPEGCoreSettings] = None,
+                 preload: float = 5.0, interval: float = 0.1,
+                 callback: Optional[Callable[[PlaybackEvent], None]] = None,
+                 queue=None):
+        self.playlist: List[str] = list(files)
+        self.preload = preload
+        self.index = -1
+        self.current: Optional[FFMPEGCore] = None
+        self._own_settings = settings is None
+        self._settings = FFMPEGCoreSettings() if settings is None else settings  # noqa: E501
+        self._callback = callback
+        self._length = None
+        # (index, handle) of the next track, handle is None if failed.
+        self._next = None
+        self._loading: Optional[Thread] = None
+        self._timer: Optional[Timer] = None
+        self._volume = 100
+        self._speed = 1.0
+        self._watcher = PlaybackWatcher(None, interval, self._on_event, queue)
+        # Events are handled while the watcher holds its lock, so the same
+        # lock is used to avoid a lock order inversion.
+        self._lock = self._watcher._lock
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.stop()
+        if self._own_settings:
+            self._settings.close()
+
+    def next(self):
+        self._switch(self.index)
+
+    def pause(self):
+        with self._lock:
+            self._cancel_timer()
+            if self.current is not None:
+                self.current.pause()
+
+    def play(self, index: Optional[int] = None):
+        # Resumes the current track if index is None.
+        with self._lock:
+            if index is None and self.current is not None:
+                self.current.play()
+                return
+            self._start(0 if index is None else index)
+
+    def previous(self):
+        self.play(max(self.index - 1, 0))
+
+    def seek(self, pos: float):
+        with self._lock:
+            self._cancel_timer()
+            if self.current is not None:
+                self.current.seek(pos)
+
+    @property
+    def speed(self) -> float:
+        return self._speed
+
+    @speed.setter
+    def speed(self, v: float):
+        with self._lock:
+            if self.current is not None:
+                self.current.speed = v
+            self._speed = float(v)
+
+    def stop(self):
+        # Can be called from callbacks, which may run with the lock held, so
+        # the watcher is not joined. It polls under the lock, so it does not
+        # touch the handle again once core is None.
+        self._watcher.stop(wait=False)
+        with self._lock:
+            self._cancel_timer()
+            self._watcher.core = None
+            self._length = None
+            if self.current is not None:
+                self.current.close()
+                self.current = None
+            self._drop_next()
+
+    @property
+    def volume(self) -> int:
+        return self._volume
+
+    @volume.setter
+    def volume(self, v: int):
+        with self._lock:
+            if self.current is not None:
+                self.current.volume = v
+            self._volume = v
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _drop_next(self):
+        if self._loading is not None:
+            self._loading.join()
+            self._loading = None
+        if self._next is not None:
+            if self._next[1] is not None:
+                self._next[1].close()
+            self._next = None
+
+    def _emit(self, ev: PlaybackEvent):
+        self._watcher._emit(ev)
+
+    def _load(self, index: int):
+        try:
+            core = self._open(index)
+            core.seek(0)
+        except FFMPEGCoreError:
+            core = None
+        self._next = (index, core)
+
+    def _on_event(self, ev: PlaybackEvent):
+        if self._callback is not None:
+            _call_callback(self._callback, ev)
+        if ev.type == ENDED:
+            self._switch(self.index)
+        elif ev.type == POSITION:
+            self._on_position(self.index, ev.position)
+
+    def _on_position(self, index: int, position: float):
+        with self._lock:
+            if index != self.index or self._length is None:
+                return
+            remaining = self._length - position
+            if remaining <= self.preload:
+                self._preload(index + 1)
+            # The end is reached before the next poll, start the next track
+            # right on time instead of waiting for the ended event.
+            if remaining <= self._watcher.interval and self._timer is None:
+                self._timer = Timer(max(remaining, 0) / self._speed,
+                                    self._switch, (index,))
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _open(self, index: int) -> FFMPEGCore:
+        core = FFMPEGCore(self.playlist[index], self._settings)
+        if self._volume != 100:
+            core.volume = self._volume
+        if self._speed != 1.0:
+            core.speed = self._speed
+        return core
+
+    def _preload(self, index: int):
+        if index >= len(self.playlist) or self._loading is not None:
+            return
+        if self._next is not None and self._next[0] == index:
+            return
+        self._loading = Thread(target=self._load, args=(index,), daemon=True)
+        self._loading.start()
+
+    def _start(self, index: int):
+        # Must hold _lock.
+        self._cancel_timer()
+        if self._loading is not None:
+            self._loading.join()
+            self._loading = None
+        core = None
+        if self._next is not None and self._next[0] == index:
+            core = self._next[1]
+            self._next = None
+        if core is None:
+            # Unreadable tracks are skipped.
+            while index < len(self.playlist):
+                try:
+                    core = self._open(index)
+                    break
+                except FFMPEGCoreError as e:
+                    self._emit(PlaybackEvent(ERROR, error=e))
+                    index += 1
+        self._drop_next()
+        old = self.current
+        self.current = core
+        self.index = index
+        if core is None:
+            self._length = None
+            self._watcher.core = None
+            # Usually called on the watcher thread, so it can not be joined.
+            self._watcher.stop(wait=False)
+            if old is not None:
+                old.close()
+            self._emit(PlaybackEvent(FINISHED, 0.0))
+            return
+        core.play()
+        self._length = core.length
+        self._watcher.core = core
+        if old is not None:
+            old.close()
+        # Started first, so a callback of TRACK can stop it again.
+        self._watcher.start()
+        self._emit(PlaybackEvent(TRACK, 0.0))
+
+    def _switch(self, index: int):
+        # Moves from track index to the next one, does nothing if it is
+        # already done.
+        with self._lock:
+            if index != self.index or self.current is None:
+                return
+            self._timer = None
+            self._start(index + 1)
+
+
+AV_LOG_QUIET = -8
+AV_LOG_PANIC = 0
+AV_LOG_FATAL = 8
+AV_LOG_ERROR = 16
+AV_LOG_WARNING = 24
+AV_LOG_INFO = 32
+AV_LOG_VERBOSE = 40
+AV_LOG_DEBUG = 48
+AV_LOG_TRACE = 56
+# Flags of set_log_flags.
+AV_LOG_SKIP_REPEATED = 1
+AV_LOG_PRINT_LEVEL = 2
+
+
+def set_log_flags(flags: int):
+    lib.ffmpeg_core_log_set_flags(flags)
+
+
+def _to_logging_level(level: int) -> int:
+    # Same values as the logging module.
+    if level <= AV_LOG_FATAL:
+        return 50
+    if level <= AV_LOG_ERROR:
+        return 40
+    if level <= AV_LOG_WARNING:
+        return 30
+    if level <= AV_LOG_INFO:
+        return 20
+    return 10
+
+
+class LogSink:
+    # Forwards the log of the library to the logging module. The library
+    # calls the callback on its own threads, so the callback does as little
+    # as possible: lines above level are dropped before anything else is
+    # done, the rest is formatted into a buffer reused per thread and
+    # appended to a bounded deque. A background thread drains the deque in
+    # batches every interval seconds. If the deque is full, the oldest
+    # lines are dropped and counted in dropped.
+    # Only one sink can be installed at the same time.
+    def __init__(self, logger=None, level: int = AV_LOG_INFO,
+                 capacity: int = 4096, interval: float = 0.2,
+                 line_size: int = 1024):
+        import logging
+        self.logger = logger if logger is not None else logging.getLogger('ffmpeg_core')  # noqa: E501
+        self.level = level
+        self.capacity = capacity
+        self.interval = interval
+        self._line_size = line_size
+        self._lines = deque(maxlen=capacity)
+        self._local = local()
+        self._count_lock = Lock()
+        self.received = 0
+        self.filtered = 0
+        self.dropped = 0
+        self._stop = Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.uninstall()
+
+    def drain(self):
+        # Writes all buffered lines to the logger.
+        lines = self._lines
+        logger = self.logger
+        while lines:
+            try:
+                level, line = lines.popleft()
+            except IndexError:
+                break
+            level = _to_logging_level(level)
+            if logger.isEnabledFor(level):
+                logger.log(level, line.decode(errors='replace').rstrip())
+
+    def install(self):
+        global _log_sink
+        if _log_sink is not None and _log_sink is not self:
+            _log_sink.uninstall()
+        lib.ffmpeg_core_log_set_callback(_log_callback)
+        _log_sink = self
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stats(self) -> Dict[str, int]:
+        return {'received': self.received, 'filtered': self.filtered,
+                'dropped': self.dropped, 'pending': len(self._lines)}
+
+    def uninstall(self):
+        # The library keeps calling the module level callback, which does
+        # nothing without a sink.
+        global _log_sink
+        if _log_sink is self:
+            _log_sink = None
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.drain()
+
+    def _on_log(self, avcl, level: int, fmt, vl):
+        if level > self.level:
+            with self._count_lock:
+                self.received += 1
+                self.filtered += 1
+            return
+        loc = self._local
+        try:
+            buf = loc.buf
+        except AttributeError:
+            buf = loc.buf = create_string_buffer(self._line_size)
+            loc.prefix = c_int(1)
+        lib.ffmpeg_core_log_format_line(avcl, level, fmt, vl, buf,
+                                        self._line_size, byref(loc.prefix))
+        with self._count_lock:
+            self.received += 1
+            if len(self._lines) >= self.capacity:
+                self.dropped += 1
+        self._lines.append((level, buf.value))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.drain()
+
+
+_log_sink: Optional[LogSink] = None
+
+
+def _on_log(avcl, level: int, fmt, vl):
+    sink = _log_sink
+    if sink is not None:
+        sink._on_log(avcl, level, fmt, vl)
+
+
+# The library may call the callback at any time once it is set, so there
+# is only one, which lives as long as the module and forwards to the sink.
+_log_callback = LOG_CALLBACK(_on_log)
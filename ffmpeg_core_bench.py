@@ -0,0 +1,113 @@
+from argparse import ArgumentParser, ArgumentTypeError
+import json
+from random import Random
+from time import perf_counter_ns
+from typing import Callable, Dict, List, Tuple
+import ffmpeg_core
+from ffmpeg_core import (
+    FFMPEGCore,
+    FFMPEGCoreInfo,
+    probe_many,
+    set_backend,
+)
+
+
+def latency_type(s: str) -> Tuple[str, float]:
+    try:
+        name, t = s.split('=', 1)
+        t = float(t)
+    except ValueError:
+        raise ArgumentTypeError(f"invalid latency: {s}")
+    if not name.startswith('ffmpeg_core_'):
+        name = 'ffmpeg_core_' + name
+    return name, t
+
+
+p = ArgumentParser(description='Measure the latency of the ffmpeg_core wrapper.')  # noqa: E501
+p.add_argument('-B', '--backend', help='The backend to use. native uses the ffmpeg_core library, mock uses ffmpeg_core_mock.py. Default: mock.', choices=['native', 'mock'], default='mock')  # noqa: E501
+p.add_argument('-n', '--number', help='The number of times every operation is run. Default: 200.', type=int, default=200)  # noqa: E501
+p.add_argument('-j', '--jobs', help='The number of workers of probe_many. Default: 4.', type=int, default=4)  # noqa: E501
+p.add_argument('-l', '--latency', help='Simulated latency of a function of the mock backend, e.g. open=0.02 or ffmpeg_core_seek=0.001. Can be specified multiple times.', type=latency_type, action='append', metavar='NAME=SECONDS')  # noqa: E501
+p.add_argument('-Z', '--no-latency', help='Disable all simulated latencies of the mock backend, so only the overhead of the wrapper is measured.', action='store_true')  # noqa: E501
+p.add_argument('--json', help='Print the result as JSON.', action='store_true')  # noqa: E501
+p.add_argument('files', help='The files to open. Required by the native backend. Default: mock.flac.', nargs='*')  # noqa: E501
+
+
+def measure(func: Callable[[int], None], n: int) -> Dict[str, float]:
+    times = []
+    for i in range(n):
+        t = perf_counter_ns()
+        func(i)
+        times.append(perf_counter_ns() - t)
+    times.sort()
+    total = sum(times)
+    return {
+        'count': n,
+        'mean_us': total / n / 1000,
+        'p50_us': times[n // 2] / 1000,
+        'p95_us': times[min(n - 1, n * 95 // 100)] / 1000,
+        'ops': n / (total / 1E9) if total else float('inf'),
+    }
+
+
+def run(files: List[str], n: int, jobs: int) -> Dict[str, Dict[str, float]]:
+    r = {}
+
+    def file(i: int) -> str:
+        return files[i % len(files)]
+
+    r['open'] = measure(lambda i: FFMPEGCore(file(i)).close(), n)
+    r['info_open'] = measure(lambda i: FFMPEGCoreInfo(file(i)).close(), n)
+    core = FFMPEGCore(files[0])
+    try:
+        length = core.length
+        rand = Random(0)
+        r['seek'] = measure(lambda i: core.seek(rand.random() * length), n)
+        r['position'] = measure(lambda i: core.position, n)
+
+        def metadata(i: int):
+            # Drops the cached tags, so every tag is read from the backend.
+            core._metadata.clear()
+            core.metadata()
+        r['metadata'] = measure(metadata, n)
+        r['metadata_cached'] = measure(lambda i: core.metadata(), n)
+    finally:
+        core.close()
+    paths = [file(i) for i in range(n)]
+    t = perf_counter_ns()
+    probe_many(paths, jobs)
+    t = perf_counter_ns() - t
+    r['probe_many'] = {'count': n, 'mean_us': t / n / 1000,
+                       'ops': n / (t / 1E9) if t else float('inf')}
+    return r
+
+
+def main(args=None):
+    arg = p.parse_intermixed_args(args)
+    files = arg.files
+    if arg.backend == 'mock':
+        from ffmpeg_core_mock import DEFAULT_LATENCY, MockBackend
+        latency = dict(arg.latency or [])
+        if arg.no_latency:
+            latency = {k: 0 for k in DEFAULT_LATENCY}
+        set_backend(MockBackend(latency))
+        if not files:
+            files = ['mock.flac']
+    elif not files:
+        p.error('The native backend needs at least one file.')
+    r = run(files, arg.number, arg.jobs)
+    if arg.json:
+        print(json.dumps({'backend': arg.backend,
+                          'version': ffmpeg_core.lib.version,
+                          'result': r}, indent=2))
+        return
+    print(f"Backend: {arg.backend}, version: {'.'.join(str(i) for i in ffmpeg_core.lib.version)}")  # noqa: E501
+    print(f"{'Operation':<16}{'Count':>8}{'Mean(us)':>12}{'P50(us)':>12}{'P95(us)':>12}{'Ops/s':>12}")  # noqa: E501
+    for k, v in r.items():
+        p50 = f"{v['p50_us']:.1f}" if 'p50_us' in v else '-'
+        p95 = f"{v['p95_us']:.1f}" if 'p95_us' in v else '-'
+        print(f"{k:<16}{v['count']:>8}{v['mean_us']:>12.1f}{p50:>12}{p95:>12}{v['ops']:>12.0f}")  # noqa: E501
+
+
+if __name__ == '__main__':
+    main()
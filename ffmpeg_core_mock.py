@@ -0,0 +1,340 @@
+from ctypes import (
+    addressof,
+    c_void_p,
+    create_string_buffer,
+    create_unicode_buffer,
+)
+from itertools import count
+from os import fsdecode, fsencode, name as os_name
+from os.path import exists
+from threading import Lock
+from time import monotonic, sleep
+from typing import Dict, Optional
+
+
+# Error codes of the library which are used by the mock.
+FFMPEG_CORE_ERR_FAILED_OPEN_FILE = 2
+FFMPEG_CORE_ERR_NULLPTR = 1
+
+# Function name -> simulated latency in seconds.
+DEFAULT_LATENCY = {
+    'ffmpeg_core_open': 0.02,
+    'ffmpeg_core_open2': 0.02,
+    'ffmpeg_core_open3': 0.02,
+    'ffmpeg_core_info_open': 0.005,
+    'ffmpeg_core_seek': 0.001,
+}
+
+
+class _Handle:
+    __slots__ = ('file', 'metadata', 'length', 'position', 'start', 'playing',
+                 'volume', 'speed')
+
+    def __init__(self, file: str, metadata: Dict[str, str], length: int):
+        self.file = file
+        self.metadata = metadata
+        self.length = length
+        self.position = 0
+        self.start = None
+        self.playing = False
+        self.volume = 100
+        self.speed = 1.0
+
+    def pos(self) -> int:
+        if self.playing:
+            now = monotonic()
+            p = self.position + int((now - self.start) * 1E6 * self.speed)
+            return min(p, self.length)
+        return self.position
+
+
+class MockBackend:
+    # Implements the function table of ffmpeg_core in Python, so
+    # ffmpeg_core.py can be used without the library and audio devices.
+    # Any path can be opened, unless strict is True, then the file must
+    # exist. Every file has length seconds of silence and the tags in
+    # metadata, plus its file name as title. latency overrides
+    # DEFAULT_LATENCY; the mock sleeps that long in the function, which
+    # releases the GIL like a real library call.
+    def __init__(self, latency: Optional[Dict[str, float]] = None,
+                 length: float = 180.0,
+                 metadata: Optional[Dict[str, str]] = None,
+                 strict: bool = False, version: int = 0x01010100):
+        self.latency = dict(DEFAULT_LATENCY)
+        if latency:
+            self.latency.update(latency)
+        self.length = int(length * 1E6)
+        self.metadata = {'artist': 'Mock Artist', 'album': 'Mock Album'}
+        if metadata:
+            self.metadata.update(metadata)
+        self.strict = strict
+        self._version = version
+        self._lock = Lock()
+        self._ids = count(1)
+        self._handles: Dict[int, _Handle] = {}
+        self._settings = set()
+        # address -> buffer of strings returned to the caller.
+        self._allocs = {}
+        self._log_callback = None
+        self._log_flags = 0
+
+    def _wait(self, name: str):
+        t = self.latency.get(name)
+        if t:
+            sleep(t)
+
+    def _new_id(self) -> int:
+        return next(self._ids) << 4
+
+    def _get(self, h) -> Optional[_Handle]:
+        if isinstance(h, c_void_p):
+            h = h.value
+        return self._handles.get(h)
+
+    def _alloc(self, s: str) -> int:
+        # Returns a pointer like the library, freed by ffmpeg_core_free.
+        # Strings are wide strings on Windows.
+        if os_name == 'nt':
+            buf = create_unicode_buffer(s)
+        else:
+            buf = create_string_buffer(fsencode(s))
+        addr = addressof(buf)
+        with self._lock:
+            self._allocs[addr] = buf
+        return addr
+
+    def _open(self, name: str, fn, h) -> int:
+        self._wait(name)
+        if isinstance(fn, bytes):
+            fn = fsdecode(fn)
+        if self.strict and not exists(fn):
+            return FFMPEG_CORE_ERR_FAILED_OPEN_FILE
+        if h is None:
+            return FFMPEG_CORE_ERR_NULLPTR
+        m = dict(self.metadata)
+        m.setdefault('title', fn.replace('\\', '/').rsplit('/', 1)[-1])
+        handle = _Handle(fn, m, self.length)
+        with self._lock:
+            i = self._new_id()
+            self._handles[i] = handle
+        h.contents.value = i
+        return 0
+
+    def _free(self, h):
+        if isinstance(h, c_void_p):
+            h = h.value
+        with self._lock:
+            self._handles.pop(h, None)
+
+    def free_music_handle(self, h):
+        self._free(h)
+
+    def free_music_info_handle(self, h):
+        self._free(h)
+
+    def free_ffmpeg_core_settings(self, s):
+        self._settings.discard(s)
+
+    def free_device_name_list(self, p):
+        pass
+
+    def ffmpeg_core_free(self, p):
+        with self._lock:
+            self._allocs.pop(p, None)
+
+    def ffmpeg_core_malloc(self, size: int) -> int:
+        buf = create_string_buffer(size)
+        addr = addressof(buf)
+        with self._lock:
+            self._allocs[addr] = buf
+        return addr
+
+    def ffmpeg_core_realloc(self, p, size: int) -> int:
+        old = self._allocs.get(p)
+        addr = self.ffmpeg_core_malloc(size)
+        if old is not None:
+            n = min(len(old), size)
+            self._allocs[addr][:n] = old.raw[:n]
+            self.ffmpeg_core_free(p)
+        return addr
+
+    def ffmpeg_core_log_format_line(self, *args) -> int:
+        # The mock never logs, so there is no va_list to format.
+        return 0
+
+    def ffmpeg_core_log_set_callback(self, callback):
+        self._log_callback = callback
+
+    def ffmpeg_core_log_set_flags(self, flags: int):
+        self._log_flags = flags
+
+    def ffmpeg_core_version_str(self) -> bytes:
+        return '.'.join(str(i) for i in self._version.to_bytes(4, 'big')).encode()  # noqa: E501
+
+    def ffmpeg_core_version(self) -> int:
+        return self._version
+
+    def ffmpeg_core_dump_library_version(self, use_av_log: int, level: int):
+        pass
+
+    def ffmpeg_core_dump_ffmpeg_configuration(self, use_av_log: int,
+                                              level: int):
+        pass
+
+    def ffmpeg_core_open(self, fn, h) -> int:
+        return self._open('ffmpeg_core_open', fn, h)
+
+    def ffmpeg_core_open2(self, fn, h, settings) -> int:
+        return self._open('ffmpeg_core_open2', fn, h)
+
+    def ffmpeg_core_open3(self, fn, h, settings, device) -> int:
+        return self._open('ffmpeg_core_open3', fn, h)
+
+    def ffmpeg_core_info_open(self, fn, h) -> int:
+        return self._open('ffmpeg_core_info_open', fn, h)
+
+    def ffmpeg_core_play(self, h) -> int:
+        self._wait('ffmpeg_core_play')
+        handle = self._get(h)
+        if handle is None:
+            return FFMPEG_CORE_ERR_NULLPTR
+        if not handle.playing:
+            handle.start = monotonic()
+            handle.playing = True
+        return 0
+
+    def ffmpeg_core_pause(self, h) -> int:
+        self._wait('ffmpeg_core_pause')
+        handle = self._get(h)
+        if handle is None:
+            return FFMPEG_CORE_ERR_NULLPTR
+        if handle.playing:
+            handle.position = handle.pos()
+            handle.playing = False
+        return 0
+
+    def ffmpeg_core_seek(self, h, pos: int) -> int:
+        self._wait('ffmpeg_core_seek')
+        handle = self._get(h)
+        if handle is None:
+            return FFMPEG_CORE_ERR_NULLPTR
+        handle.position = max(0, min(pos, handle.length))
+        handle.start = monotonic()
+        return 0
+
+    def ffmpeg_core_set_volume(self, h, volume: int) -> int:
+        handle = self._get(h)
+        if handle is None:
+            return FFMPEG_CORE_ERR_NULLPTR
+        handle.volume = volume
+        return 0
+
+    def ffmpeg_core_set_speed(self, h, speed: float) -> int:
+        handle = self._get(h)
+        if handle is None:
+            return FFMPEG_CORE_ERR_NULLPTR
+        handle.position = handle.pos()
+        handle.start = monotonic()
+        handle.speed = speed
+        return 0
+
+    def ffmpeg_core_set_equalizer_channel(self, h, channel: int,
+                                          gain: int) -> int:
+        return 0
+
+    def ffmpeg_core_get_error(self, h) -> int:
+        return 0
+
+    def ffmpeg_core_get_err_msg(self, err: int) -> int:
+        return self._alloc(f"Mock error {err}")
+
+    def ffmpeg_core_get_err_msg2(self, err: int):
+        msg = f"Mock error {err}"
+        return msg if os_name == 'nt' else msg.encode()
+
+    def ffmpeg_core_get_cur_position(self, h) -> int:
+        self._wait('ffmpeg_core_get_cur_position')
+        handle = self._get(h)
+        return handle.pos() if handle is not None else -1
+
+    def ffmpeg_core_song_is_over(self, h) -> int:
+        handle = self._get(h)
+        return 1 if handle is not None and handle.pos() >= handle.length else 0  # noqa: E501
+
+    def ffmpeg_core_get_song_length(self, h) -> int:
+        handle = self._get(h)
+        return handle.length if handle is not None else -1
+
+    def ffmpeg_core_info_get_song_length(self, h) -> int:
+        return self.ffmpeg_core_get_song_length(h)
+
+    def ffmpeg_core_get_channels(self, h) -> int:
+        return 2 if self._get(h) is not None else -1
+
+    def ffmpeg_core_info_get_channels(self, h) -> int:
+        return self.ffmpeg_core_get_channels(h)
+
+    def ffmpeg_core_get_freq(self, h) -> int:
+        return 44100 if self._get(h) is not None else -1
+
+    def ffmpeg_core_info_get_freq(self, h) -> int:
+        return self.ffmpeg_core_get_freq(h)
+
+    def ffmpeg_core_is_playing(self, h) -> int:
+        handle = self._get(h)
+        if handle is None:
+            return 0
+        return 1 if handle.playing and handle.pos() < handle.length else 0
+
+    def ffmpeg_core_get_bits(self, h) -> int:
+        return 16 if self._get(h) is not None else -1
+
+    def ffmpeg_core_info_get_bits(self, h) -> int:
+        return self.ffmpeg_core_get_bits(h)
+
+    def ffmpeg_core_get_bitrate(self, h) -> int:
+        return 1411200 if self._get(h) is not None else -1
+
+    def ffmpeg_core_info_get_bitrate(self, h) -> int:
+        return self.ffmpeg_core_get_bitrate(h)
+
+    def ffmpeg_core_get_metadata(self, h, key: bytes) -> Optional[int]:
+        self._wait('ffmpeg_core_get_metadata')
+        handle = self._get(h)
+        if handle is None:
+            return None
+        v = handle.metadata.get(key.decode())
+        return self._alloc(v) if v is not None else None
+
+    def ffmpeg_core_info_get_metadata(self, h, key: bytes) -> Optional[int]:
+        return self.ffmpeg_core_get_metadata(h, key)
+
+    def ffmpeg_core_init_settings(self) -> int:
+        with self._lock:
+            s = self._new_id()
+        self._settings.add(s)
+        return s
+
+    def ffmpeg_core_is_wasapi_supported(self) -> int:
+        return 0
+
+    def ffmpeg_core_settings_set_use_WASAPI(self, s, enable: int) -> int:
+        return 0
+
+    def ffmpeg_core_settings_set_enable_exclusive(self, s,
+                                                  enable: int) -> int:
+        return 0
+
+    def ffmpeg_core_settings_set_max_wait_time(self, s, t: int) -> int:
+        return 0
+
+    def ffmpeg_core_settings_set_wasapi_min_buffer_time(self, s,
+                                                        t: int) -> int:
+        return 0
+
+    def ffmpeg_core_set_reverb(self, h, type: int, mix: float,
+                               time: float) -> int:
+        return 0
+
+    def ffmpeg_core_settings_set_max_wait_buffer_time(self, s, t: int) -> int:
+        return 0
@@ -1,12 +1,13 @@
 from argparse import ArgumentParser
-from os import listdir
-from os.path import isdir, isfile, join
+from os.path import isdir, isfile
 import re
 from typing import List
 import taglib
+from util import walk
 
 
 ARTIST_SEP = re.compile(r'(/|&|;)')
+MUSIC_PATTERNS = ['*.m4a', '*.flac', '*.mp3']
 
 
 def get_files(dir: str, r: bool) -> List[str]:
@@ -14,16 +15,7 @@ def get_files(dir: str, r: bool) -> List[str]:
         return [dir]
     if not isdir(dir):
         return []
-    files = listdir(dir)
-    re = []
-    for file in files:
-        file = join(dir, file)
-        if isdir(file):
-            if r:
-                re += get_files(file, r)
-        elif file.endswith('.m4a') or file.endswith(".flac") or file.endswith(".mp3"):  # noqa: E501
-            re.append(file)
-    return re
+    return [e.path for e in walk(dir, r, include=MUSIC_PATTERNS)]
 
 
 def fix_tag(file: str, verbose: bool):
@@ -1,108 +1,391 @@
-from argparse import ArgumentParser
-import hashlib
-from os import listdir
-from os.path import getsize, isdir, isfile, join, relpath
-try:
-    from rich.live import Live
-    from rich.progress import (
-        Progress,
-        SpinnerColumn,
-        BarColumn,
-        TextColumn,
-        TimeRemainingColumn,
-        TransferSpeedColumn,
-        DownloadColumn,
-        MofNCompleteColumn,
-    )
-    from rich.table import Table
-    have_rich = True
-except ImportError:
-    have_rich = False
+from argparse import ArgumentParser, ArgumentTypeError
+from contextlib import ExitStack
+from os import replace, sep
+from os.path import getsize, isdir, isfile, join, relpath, splitext
+from time import monotonic
+from typing import Dict, List, Optional, Union
+from hash_util import (
+    BLOCK_SIZE,
+    METHODS,
+    HashCache,
+    format_header,
+    format_tagged,
+    get_merkle_output,
+    hash_file,
+    iter_cached_hashes,
+    iter_hashes,
+    iter_merkle,
+    load_tree,
+    merkle_tree,
+    open_manifest,
+    parse_size,
+    parse_methods,
+)
+from inotify_util import (
+    IN_CLOSE_WRITE,
+    IN_CREATE,
+    IN_DELETE,
+    IN_EXCL_UNLINK,
+    IN_IGNORED,
+    IN_ISDIR,
+    IN_MOVED_FROM,
+    IN_MOVED_TO,
+    IN_ONLYDIR,
+    IN_Q_OVERFLOW,
+    Event,
+    Inotify,
+)
+from progress_util import ProgressReporter
+from util import walk
+
+
+def methods_type(s: str) -> List[str]:
+    try:
+        return parse_methods(s)
+    except ValueError as e:
+        raise ArgumentTypeError(str(e))
+
+
+def size_type(s: str) -> int:
+    try:
+        return parse_size(s)
+    except ValueError:
+        raise ArgumentTypeError(f"invalid size: {s}")
 
 
 p = ArgumentParser(description='Generate checksum of files.')
 p.add_argument('-a', '--all', help='Include all files, including hidden files.', action='store_true')  # noqa: E501
-p.add_argument("-o", "--output", help='The path to output file. Default: checksum.txt. Releative path is relative to the input directory.', default="checksum.txt")  # noqa: E501
-p.add_argument("-m", "--method", help='The hash method to use. Default: md5. Available choices: md5, sha1, sha224, sha256, sha384, sha512.', choices=['md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512'], metavar='METHOD', default="md5")  # noqa: E501
+p.add_argument("-o", "--output", help='The path to output file. Default: checksum.txt. Releative path is relative to the input directory. Add .gz, .xz or .zst to compress it.', default="checksum.txt")  # noqa: E501
+p.add_argument("-m", "--method", help='The hash method to use. Multiple methods can be separated by comma, every file is only read once. Default: md5. Available choices: ' + ', '.join(METHODS) + '. xxh3 and xxh128 need xxhash, blake3 needs blake3.', type=methods_type, metavar='METHOD', default="md5")  # noqa: E501
+p.add_argument("-c", "--combined", help='Write all methods into one manifest instead of one manifest per method.', action='store_true')  # noqa: E501
+p.add_argument("-j", "--jobs", help='The number of files to hash at the same time. Default: 1.', type=int, default=1)  # noqa: E501
+p.add_argument("-P", "--process", help='Use a process pool instead of a thread pool when jobs is greater than 1.', action='store_true')  # noqa: E501
+p.add_argument("-b", "--block-size", help='The size of the read buffer in bytes. Default: 1048576.', type=int, default=BLOCK_SIZE)  # noqa: E501
+p.add_argument("--mmap", help='Map files into memory instead of reading them into a buffer.', action='store_true')  # noqa: E501
+p.add_argument("--nocache", help='Drop hashed files from the page cache, so hashing a large tree does not evict the cache of other programs. Only works on systems which support posix_fadvise.', action='store_true')  # noqa: E501
+p.add_argument("--bwlimit", help='Limit the total read speed, in bytes per second. Suffixes K, M and G can be used, e.g. 50M.', type=size_type, metavar='RATE')  # noqa: E501
+p.add_argument("-i", "--incremental", help='Reuse digests of unchanged files from the cache database.', action='store_true')  # noqa: E501
+p.add_argument("--cache", help='The path to the cache database used by incremental mode. Default: .checksum.db. Releative path is relative to the input directory.', default=".checksum.db")  # noqa: E501
+p.add_argument("--rehash-older-than", help='Hash files again if their cached digest is older than this many days, so silent corruption is still detected.', type=float, metavar='DAYS')  # noqa: E501
+p.add_argument("-M", "--merkle", help='Also write the Merkle digest of every directory to a file named like the output file with .merkle before the extension.', action='store_true')  # noqa: E501
+p.add_argument("-w", "--watch", help='Keep running after the checksum is generated and update the output files (and the cache database) when files are created, modified, moved or deleted. Linux only.', action='store_true')  # noqa: E501
+p.add_argument("--debounce", help='In watch mode, wait until no file is changed for this many seconds before updating. Default: 2.', type=float, default=2.0, metavar='SECONDS')  # noqa: E501
 p.add_argument("input", help='The path to the input file or directory.', nargs='*', default=['.'])  # noqa: E501
 
 
-def list_files(input: str, all: bool, output=None):
-    files = []
-    for i in listdir(input):
-        if not all and i.startswith('.'):
-            continue
-        path = join(input, i)
-        if isfile(path):
-            files.append(path)
-        elif isdir(path):
-            files.extend(list_files(path, all, None))
+def list_files(input: str, all: bool, output: Union[str, List[str]] = None,
+               jobs: int = 1):
+    files = [e.path for e in walk(input, hidden=all, jobs=jobs)]
     if output is not None:
-        output_file = join(input, output)
-        if output_file in files:
-            files.remove(output_file)
+        for o in [output] if isinstance(output, str) else output:
+            output_file = join(input, o)
+            if output_file in files:
+                files.remove(output_file)
     return files
 
 
-def cal_hash(file: str, method: str, task=None, progress=None):
-    h = hashlib.new(method)
-    with open(file, 'rb') as f:
-        while True:
-            data = f.read(40960)
-            if not data:
-                break
-            h.update(data)
-            if progress is not None and task is not None:
-                progress.update(task, advance=len(data))
-    t = f"{h.hexdigest()}  {file}\n"
+def get_outputs(output: str, methods: List[str], combined: bool) -> List[str]:
+    if len(methods) == 1 or combined:
+        return [output]
+    name, ext = splitext(output)
+    return [f"{name}.{m}{ext}" for m in methods]
+
+
+def format_lines(methods: List[str], combined: bool, pa: str,
+                 h: List[str]) -> List[str]:
+    if len(methods) > 1 and combined:
+        return [f"{format_tagged(methods, h)}  {pa}\n"]
+    return [f"{d}  {pa}\n" for d in h]
+
+
+def hash_files(arg, input: str, files, methods: List[str],
+               cache: Optional[HashCache] = None, begin=None, end=None):
+    if arg.rehash_older_than is not None:
+        max_age = arg.rehash_older_than * 86400
+    else:
+        max_age = None
+
+    def on_changed(pa: str, method: str, old: str, new: str):
+        print(f"WARNING: {method} of {pa} changed from {old} to {new} but the file is not modified.")  # noqa: E501
+    if cache is not None:
+        return iter_cached_hashes(
+            files, methods, cache, lambda pa: relpath(pa, input), max_age,
+            on_changed, jobs=arg.jobs, process=arg.process, begin=begin,
+            end=end, block_size=arg.block_size, use_mmap=arg.mmap,
+            nocache=arg.nocache, bwlimit=arg.bwlimit)
+    return iter_hashes(files, methods, arg.jobs, arg.process, begin, end,
+                       arg.block_size, arg.mmap, arg.nocache, arg.bwlimit)
+
+
+def cal_hash(file: str, method: str, task=None, progress=None,
+             block_size: int = BLOCK_SIZE, use_mmap: bool = False):
+    if progress is not None and task is not None:
+        def callback(size: int):
+            progress.update(task, advance=size)
+    else:
+        callback = None
+    h = hash_file(file, method, callback, block_size, use_mmap)
+    t = f"{h}  {file}\n"
     if progress is None or task is None:
         print(t, end='')
     return t
 
 
+def write_merkle(manifest: str, output: str, base: str):
+    # Names in the manifest start with base, which is stripped again.
+    with open_manifest(manifest) as f:
+        method, tree = load_tree(f, base=base)
+    if method is None:
+        return
+    with open_manifest(output, 'w') as f:
+        f.write(f'# method: {method}\n')
+        for path, digest in iter_merkle(merkle_tree(tree, method)):
+            f.write(f"{digest}  {path}/\n")
+
+
+def get_tmp_output(output: str) -> str:
+    # Keep the extension, so the compression stays the same.
+    name, ext = splitext(output)
+    return f"{name}.tmp{ext}"
+
+
+def write_manifests(input: str, outputs: List[str], methods: List[str],
+                    combined: bool, entries: Dict[str, List[str]]):
+    with ExitStack() as stack:
+        fs = [stack.enter_context(open_manifest(get_tmp_output(join(input, o)), 'w'))  # noqa: E501
+              for o in outputs]
+        if len(methods) == 1 or not combined:
+            for f, m in zip(fs, methods):
+                f.write(format_header(m))
+        for pa, h in entries.items():
+            for f, line in zip(fs, format_lines(methods, combined, pa, h)):
+                f.write(line)
+    for o in outputs:
+        replace(get_tmp_output(join(input, o)), join(input, o))
+
+
+class Watcher:
+    # Keeps the output files of gen_hash.py up to date with inotify. Changed
+    # paths are collected until nothing changes for arg.debounce seconds,
+    # then only these files are hashed again.
+    MASK = (IN_CLOSE_WRITE | IN_CREATE | IN_DELETE | IN_MOVED_FROM
+            | IN_MOVED_TO | IN_ONLYDIR | IN_EXCL_UNLINK)
+
+    def __init__(self, arg, methods: List[str], outputs: List[str],
+                 excludes: List[str]):
+        self._arg = arg
+        self._methods = methods
+        self._outputs = outputs
+        self._excludes = excludes
+        self._ino = Inotify()
+        # watch descriptor -> (input, directory)
+        self._wds: Dict[int, tuple] = {}
+        # input -> file -> digests
+        self.entries: Dict[str, Dict[str, List[str]]] = {}
+        # changed path -> input
+        self._dirty: Dict[str, str] = {}
+        for i in arg.input:
+            self.entries[i] = {}
+            self._add_tree(i, i, False)
+
+    def _add_tree(self, input: str, top: str, mark: bool = True):
+        self._add_watch(input, top)
+        for e in walk(top, hidden=self._arg.all, files_only=False):
+            if e.is_dir(follow_symlinks=False):
+                self._add_watch(input, e.path)
+            elif mark and e.is_file():
+                self._mark(input, e.path)
+
+    def _add_watch(self, input: str, path: str):
+        try:
+            self._wds[self._ino.add_watch(path, self.MASK)] = (input, path)
+        except OSError as e:
+            print(f"Failed to watch {path}: {e}")
+
+    def _ignored(self, input: str, path: str) -> bool:
+        for o in self._excludes:
+            o = join(input, o)
+            if path == o or path.startswith(o + '-'):
+                # Includes the journal files of the cache database.
+                return True
+        return any(path == get_tmp_output(join(input, o))
+                   for o in self._outputs)
+
+    def _mark(self, input: str, path: str):
+        if not self._ignored(input, path):
+            self._dirty[path] = input
+
+    def _remove_tree(self, input: str, path: str):
+        prefix = path + sep
+        for pa in self.entries[input]:
+            if pa.startswith(prefix):
+                self._dirty[pa] = input
+        for wd, (_, d) in list(self._wds.items()):
+            if d == path or d.startswith(prefix):
+                self._ino.rm_watch(wd)
+                del self._wds[wd]
+
+    def _rescan(self):
+        # Events were lost, so every file is checked again.
+        for i, entries in self.entries.items():
+            for pa in entries:
+                self._dirty[pa] = i
+            self._add_tree(i, i)
+
+    def _handle(self, ev: Event):
+        if ev.mask & IN_Q_OVERFLOW:
+            print("WARNING: Too many changes, rescanning all files.")
+            self._rescan()
+            return
+        if ev.mask & IN_IGNORED:
+            self._wds.pop(ev.wd, None)
+            return
+        if ev.wd not in self._wds or not ev.name:
+            return
+        if not self._arg.all and ev.name.startswith('.'):
+            return
+        input, d = self._wds[ev.wd]
+        path = join(d, ev.name)
+        if ev.mask & IN_ISDIR:
+            if ev.mask & (IN_CREATE | IN_MOVED_TO):
+                self._add_tree(input, path)
+            elif ev.mask & (IN_DELETE | IN_MOVED_FROM):
+                self._remove_tree(input, path)
+        else:
+            self._mark(input, path)
+
+    def _flush(self, caches: Dict[str, HashCache]):
+        dirty = self._dirty
+        self._dirty = {}
+        for i, entries in self.entries.items():
+            paths = [pa for pa in dirty if dirty[pa] == i]
+            if not paths:
+                continue
+            cache = caches.get(i)
+            files = []
+            for pa in paths:
+                if isfile(pa):
+                    files.append(pa)
+                elif entries.pop(pa, None) is not None:
+                    print(f"Removed {pa}")
+                    if cache is not None:
+                        cache.remove(relpath(pa, i))
+            for pa, h, e in hash_files(self._arg, i, files, self._methods,
+                                       cache):
+                if e is not None:
+                    # The file may be removed or be still written, it is
+                    # checked again on the next event.
+                    print(f"Failed to hash {pa}: {e}")
+                    if entries.pop(pa, None) is not None and cache is not None:
+                        cache.remove(relpath(pa, i))
+                    continue
+                if entries.get(pa) != h:
+                    print(f"{'Updated' if pa in entries else 'Added'} {pa}")
+                entries[pa] = h
+            write_manifests(i, self._outputs, self._methods,
+                            self._arg.combined, entries)
+            if self._arg.merkle:
+                write_merkle(join(i, self._outputs[0]),
+                             join(i, get_merkle_output(self._arg.output)), i)
+            if cache is not None:
+                cache.commit()
+
+    def run(self):
+        debounce = self._arg.debounce
+        with ExitStack() as stack:
+            stack.callback(self._ino.close)
+            caches = {}
+            if self._arg.incremental:
+                for i in self.entries:
+                    caches[i] = stack.enter_context(
+                        HashCache(join(i, self._arg.cache)))
+            print("Watching for changes...")
+            last = first = None
+            while True:
+                if self._dirty:
+                    timeout = max(0, last + debounce - monotonic())
+                else:
+                    timeout = None
+                changed = False
+                for ev in self._ino.read(timeout):
+                    self._handle(ev)
+                    changed = True
+                now = monotonic()
+                if changed:
+                    last = now
+                    if first is None:
+                        first = now
+                if not self._dirty:
+                    first = None
+                    continue
+                # Files which are changed all the time are still updated
+                # from time to time.
+                if now - last >= debounce or now - first >= debounce * 10:
+                    self._flush(caches)
+                    first = None
+
+
 def main(args=None):
     arg = p.parse_intermixed_args(args)
+    methods = arg.method
+    outputs = get_outputs(arg.output, methods, arg.combined)
+    excludes = outputs.copy()
+    # Also excluded without -M, so an old one is not hashed.
+    excludes.append(get_merkle_output(arg.output))
+    if arg.incremental:
+        excludes.append(arg.cache)
+    if arg.watch:
+        if not all(isdir(i) for i in arg.input):
+            p.error("Watch mode needs input directories.")
+        # Watches are added first, so no change made while generating the
+        # checksum is missed.
+        watcher = Watcher(arg, methods, outputs, excludes)
     for i in arg.input:
-        files = list_files(i, arg.all, arg.output)
-        output_file = join(i, arg.output)
-        with open(output_file, encoding='UTF-8', mode='w', newline='\n') as f:
-            if have_rich:
-                progress = Progress("{task.description}",
-                                    SpinnerColumn(),
-                                    BarColumn(),
-                                    TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),  # noqa: E501
-                                    MofNCompleteColumn(),
-                                    )
-                job_progress = Progress("{task.description}",
-                                        SpinnerColumn(),
-                                        BarColumn(),
-                                        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),  # noqa: E501
-                                        DownloadColumn(),
-                                        TransferSpeedColumn(),
-                                        TimeRemainingColumn(),
-                                        )
-                total_tasks = progress.add_task("Generating checksum...",
-                                                total=len(files))
-                progress_table = Table.grid()
-                progress_table.add_row(progress)
-                progress_table.add_row(job_progress)
-                live = Live(progress_table, refresh_per_second=10)
-                try:
-                    live.start()
-                    for pa in files:
-                        rp = relpath(pa, i)
-                        task = job_progress.add_task(f"Calculating {rp}...",
-                                                     total=getsize(pa))
-                        f.write(cal_hash(pa, arg.method, task, job_progress))
-                        progress.update(total_tasks, advance=1)
-                        job_progress.remove_task(task)
-                finally:
-                    progress.stop()
-                    job_progress.stop()
-                    live.stop()
+        files = list_files(i, arg.all, excludes, arg.jobs)
+        with ExitStack() as stack:
+            fs = [stack.enter_context(open_manifest(join(i, o), 'w'))
+                  for o in outputs]
+            if len(methods) == 1 or not arg.combined:
+                for f, m in zip(fs, methods):
+                    f.write(format_header(m))
+            if arg.incremental:
+                cache = stack.enter_context(HashCache(join(i, arg.cache)))
             else:
-                for i in files:
-                    f.write(cal_hash(i, arg.method))
+                cache = None
+
+            def results(begin=None, end=None):
+                yield from hash_files(arg, i, files, methods, cache, begin,
+                                      end)
+                if cache is not None:
+                    cache.prune(relpath(pa, i) for pa in files)
+
+            def write(pa: str, h: List[str]):
+                t = format_lines(methods, arg.combined, pa, h)
+                for f, line in zip(fs, t):
+                    f.write(line)
+                if arg.watch:
+                    watcher.entries[i][pa] = h
+                return t
+            with ProgressReporter("Generating checksum...",
+                                  len(files)) as progress:
+                def begin(pa: str):
+                    return progress.begin(relpath(pa, i), getsize(pa))
+
+                def end(pa: str):
+                    progress.end(relpath(pa, i))
+                for pa, h, e in results(begin, end):
+                    if e is not None:
+                        raise e
+                    t = write(pa, h)
+                    progress.advance()
+                    if not progress.rich:
+                        for line in t:
+                            print(line, end='')
+        if arg.merkle:
+            write_merkle(join(i, outputs[0]),
+                         join(i, get_merkle_output(arg.output)), i)
+    if arg.watch:
+        watcher.run()
 
 
 if __name__ == '__main__':
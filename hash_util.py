@@ -0,0 +1,688 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import chain
+import gzip
+import hashlib
+import lzma
+from mmap import ACCESS_READ, PAGESIZE, mmap
+try:
+    from mmap import MADV_SEQUENTIAL
+except ImportError:
+    MADV_SEQUENTIAL = None
+import os
+from os import fstat, stat, stat_result
+from os.path import abspath, getsize, relpath, splitext
+import sqlite3
+from threading import Lock
+from time import monotonic, sleep, time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    TextIO,
+    Tuple,
+    Union,
+)
+try:
+    import zstandard
+    have_zstd = True
+except ImportError:
+    have_zstd = False
+try:
+    import xxhash
+    have_xxhash = True
+except ImportError:
+    have_xxhash = False
+try:
+    import blake3
+    have_blake3 = True
+except ImportError:
+    have_blake3 = False
+
+
+BLOCK_SIZE = 1024 * 1024
+# Methods whose manifests have no header, the method is guessed from the
+# length of the digest.
+LEGACY_METHODS = ['md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512']
+METHODS = LEGACY_METHODS + ['blake2b', 'blake2s']
+if have_xxhash:
+    METHODS += ['xxh3', 'xxh128']
+if have_blake3:
+    METHODS.append('blake3')
+# Cheapest first. Used to pick which digest to verify when a manifest
+# contains several.
+COST_ORDER = ['xxh3', 'xxh128', 'blake3', 'blake2b', 'md5', 'sha1', 'blake2s',
+              'sha512', 'sha384', 'sha256', 'sha224']
+Method = Union[str, Sequence[str]]
+ProgressCallback = Callable[[int], None]
+
+
+def parse_methods(s: str) -> List[str]:
+    methods = []
+    for m in s.split(','):
+        m = m.strip().lower()
+        if m in ['xxh3', 'xxh128'] and not have_xxhash:
+            raise ValueError('xxhash not installed but can be installed with pip install xxhash.')  # noqa: E501
+        if m == 'blake3' and not have_blake3:
+            raise ValueError('blake3 not installed but can be installed with pip install blake3.')  # noqa: E501
+        if m not in METHODS:
+            raise ValueError(f'Unknown hash method: {m}')
+        if m not in methods:
+            methods.append(m)
+    if not methods:
+        raise ValueError('No hash method specified.')
+    return methods
+
+
+def new_hash(method: str):
+    if method == 'xxh3':
+        return xxhash.xxh3_64()
+    if method == 'xxh128':
+        return xxhash.xxh3_128()
+    if method == 'blake3':
+        return blake3.blake3()
+    return hashlib.new(method)
+
+
+def cheapest_method(methods: Iterable[str]) -> str:
+    methods = list(methods)
+    for m in COST_ORDER:
+        if m in methods:
+            return m
+    return methods[0]
+
+
+def format_tagged(methods: Sequence[str], digests: Sequence[str]) -> str:
+    return ' '.join(f'{m}:{d}' for m, d in zip(methods, digests))
+
+
+def parse_tagged(s: str) -> Dict[str, str]:
+    re = {}
+    for i in s.split(' '):
+        m, d = i.split(':', 1)
+        re[m] = d
+    return re
+
+
+def _zstd_open(path: str, mode: str) -> TextIO:
+    if not have_zstd:
+        raise ValueError('zstandard not installed but can be installed with pip install zstandard.')  # noqa: E501
+    return zstandard.open(path, mode + 't', encoding='UTF-8', newline='\n')
+
+
+def detect_compression(path: str) -> str:
+    # Returns the extension of the compression of a file by its magic, or
+    # an empty string if it is not compressed.
+    with open(path, 'rb') as f:
+        magic = f.read(6)
+    if magic.startswith(b'\x1f\x8b'):
+        return '.gz'
+    if magic.startswith(b'\xfd7zXZ\x00'):
+        return '.xz'
+    if magic.startswith(b'\x28\xb5\x2f\xfd'):
+        return '.zst'
+    return ''
+
+
+def count_manifest(path: str) -> Optional[int]:
+    # Counts the entries of an uncompressed manifest, which is cheap and
+    # leaves it in the page cache for the actual read. Returns None for
+    # compressed ones, which would have to be decompressed twice.
+    if detect_compression(path):
+        return None
+    count = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip() and not line.startswith(b'#'):
+                count += 1
+    return count
+
+
+def open_manifest(path: str, mode: str = 'r') -> TextIO:
+    # Compressed manifests are detected by magic when reading and by the
+    # extension (.gz, .xz, .zst) when writing.
+    if mode == 'r':
+        ext = detect_compression(path)
+    else:
+        ext = splitext(path)[1].lower()
+    if ext == '.gz':
+        return gzip.open(path, mode + 't', encoding='UTF-8', newline='\n')
+    if ext == '.xz':
+        return lzma.open(path, mode + 't', encoding='UTF-8', newline='\n')
+    if ext in ['.zst', '.zstd']:
+        return _zstd_open(path, mode)
+    return open(path, mode, encoding='UTF-8', newline='\n')
+
+
+def format_header(method: str) -> str:
+    # Digests of the newer methods have the same length as the legacy ones,
+    # so their manifests start with a header which names the method.
+    return '' if method in LEGACY_METHODS else f'# method: {method}\n'
+
+
+def iter_manifest(f: TextIO, header: Optional[Dict[str, str]] = None,
+                  ) -> Iterator[Tuple[str, str]]:
+    # Yields (digest, file) for every entry without loading the whole
+    # manifest into memory. Header lines (# key: value) are stored in
+    # header.
+    for line in f:
+        if not line.strip():
+            continue
+        if line.startswith('#'):
+            key, _, value = line[1:].partition(':')
+            if header is not None:
+                header[key.strip()] = value.strip()
+            continue
+        digest, _, file = line.rstrip('\r\n').partition('  ')
+        yield digest, file
+
+
+def detect_method(h: str, method: str,
+                  header: Dict[str, str]) -> Tuple[str, bool]:
+    # Returns (method, tagged). h is the digest field of the first entry.
+    if 'method' in header:
+        m = header['method']
+        if method not in ['auto', m]:
+            raise ValueError(f'{method} is not in the checksum file.')
+        return m, False
+    if ':' in h:
+        methods = parse_tagged(h)
+        if method == 'auto':
+            return cheapest_method(methods), True
+        elif method in methods:
+            return method, True
+        else:
+            raise ValueError(f'{method} is not in the checksum file.')
+    if method != 'auto':
+        return method, False
+    if len(h) == 32:
+        return 'md5', False
+    elif len(h) == 40:
+        return 'sha1', False
+    elif len(h) == 56:
+        return 'sha224', False
+    elif len(h) == 64:
+        return 'sha256', False
+    elif len(h) == 96:
+        return 'sha384', False
+    elif len(h) == 128:
+        return 'sha512', False
+    else:
+        raise ValueError('Unknown hash method.')
+
+
+def strip_base(name: str, base: str) -> str:
+    # gen_hash.py writes names relative to the directory it was run in, so
+    # they start with its input path, e.g. a/x for input a. Names under base
+    # are made relative to it, other names are already relative to the
+    # directory of the manifest, e.g. ./x when it was run in a.
+    r = relpath(abspath(name), abspath(base))
+    if r == '..' or r.startswith('..' + os.sep):
+        return name
+    return r
+
+
+def load_tree(f: TextIO, method: str = 'auto', base: Optional[str] = None,
+              skip: Optional[Set[str]] = None,
+              ) -> Tuple[Optional[str], Dict[str, Any]]:
+    # Loads a manifest into nested dicts, directories are dicts and files
+    # are digests. Names are made relative to base if given. Files directly
+    # in a directory of skip (paths like ./a/b, see iter_merkle) are left
+    # out.
+    header = {}
+    entries = iter_manifest(f, header)
+    first = next(entries, None)
+    if first is None:
+        return None, {}
+    method, tagged = detect_method(first[0], method, header)
+    tree = {}
+    for digest, name in chain([first], entries):
+        if tagged:
+            digest = parse_tagged(digest)[method]
+        if base is not None:
+            name = strip_base(name, base)
+        parts = [p for p in name.replace('\\', '/').split('/')
+                 if p not in ['', '.']]
+        if not parts:
+            continue
+        if skip and '/'.join(['.'] + parts[:-1]) in skip:
+            continue
+        node = tree
+        for p in parts[:-1]:
+            node = node.setdefault(p, {})
+        node[parts[-1]] = digest
+    return method, tree
+
+
+MerkleNode = Tuple[str, Optional[Dict[str, Any]]]
+
+
+def merkle_tree(tree: Dict[str, Any], method: str) -> MerkleNode:
+    # Returns (digest, children) for a tree from load_tree. The digest of a
+    # directory is the hash over the sorted (type, digest, name) lines of
+    # its children, files have None as children.
+    children = {}
+    h = new_hash(method)
+    for name in sorted(tree):
+        v = tree[name]
+        if isinstance(v, dict):
+            node = merkle_tree(v, method)
+            kind = 'd'
+        else:
+            node = (v, None)
+            kind = 'f'
+        children[name] = node
+        h.update(f'{kind} {node[0]} {name}\n'.encode('UTF-8', 'surrogateescape'))  # noqa: E501
+    return h.hexdigest(), children
+
+
+def iter_merkle(node: MerkleNode, path: str = '.',
+                ) -> Iterator[Tuple[str, str]]:
+    # Yields (path, digest) of every directory, parents first.
+    yield path, node[0]
+    for name, child in node[1].items():
+        if child[1] is not None:
+            yield from iter_merkle(child, f'{path}/{name}')
+
+
+def get_merkle_output(output: str) -> str:
+    # The file gen_hash.py -M writes next to the manifest output.
+    name, ext = splitext(output)
+    return f"{name}.merkle{ext}"
+
+
+def load_merkle(f: TextIO) -> Tuple[Optional[str], Dict[str, str]]:
+    # Returns (method, {path: digest}) of every directory in a file written
+    # by gen_hash.py -M.
+    header = {}
+    dirs = {}
+    for digest, path in iter_manifest(f, header):
+        dirs[path.rstrip('/') or '.'] = digest
+    return header.get('method'), dirs
+
+
+def diff_merkle(a: MerkleNode, b: MerkleNode, path: str = '.',
+                ) -> Iterator[Tuple[str, str]]:
+    # Compares two trees top down and yields (change, path), change is one
+    # of '+' (only in b), '-' (only in a) and 'M' (modified). Directories
+    # with the same digest are skipped without looking at their children.
+    if a[0] == b[0]:
+        return
+    ac = a[1]
+    bc = b[1]
+    for name in sorted(set(ac) | set(bc)):
+        p = f'{path}/{name}'
+        if name not in bc:
+            yield '-', p
+        elif name not in ac:
+            yield '+', p
+        elif ac[name][1] is not None and bc[name][1] is not None:
+            yield from diff_merkle(ac[name], bc[name], p)
+        elif ac[name][0] != bc[name][0]:
+            yield 'M', p
+
+
+def parse_size(s: str) -> int:
+    # Accepts sizes like 4096, 64K, 10M or 1G.
+    s = s.strip().upper().rstrip('B')
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    if s and s[-1] in units:
+        return int(float(s[:-1]) * units[s[-1]])
+    return int(s)
+
+
+class RateLimiter:
+    # Limits the total read speed of all threads which share it.
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._lock = Lock()
+        self._next = monotonic()
+
+    def __getstate__(self):
+        return self.rate
+
+    def __setstate__(self, rate: float):
+        self.__init__(rate)
+
+    def consume(self, n: int):
+        with self._lock:
+            now = monotonic()
+            self._next = max(self._next, now) + n / self.rate
+            delay = self._next - now
+        if delay > 0:
+            sleep(delay)
+
+
+have_fadvise = hasattr(os, 'posix_fadvise')
+# Pages are dropped in steps of this size when nocache is used.
+DROP_SIZE = 8 * 1024 * 1024
+
+
+def feed_file(file: str, update: Callable[[memoryview], None],
+              callback: Optional[ProgressCallback] = None,
+              block_size: int = BLOCK_SIZE, use_mmap: bool = False,
+              nocache: bool = False, limiter: Optional[RateLimiter] = None):
+    # Chunks passed to update are views which are only valid during the
+    # call. They come from one reused buffer (or the mapping itself), so no
+    # bytes object is allocated per chunk.
+    # With nocache, the kernel is told that the file is read sequentially
+    # and the pages which are already hashed are dropped from the page
+    # cache, so a big scrub does not evict the cache of other processes.
+    nocache = nocache and have_fadvise
+    if nocache:
+        # Whole pages can be dropped only if reads are page aligned.
+        block_size = -(-block_size // PAGESIZE) * PAGESIZE
+    with open(file, 'rb', buffering=0) as f:
+        fd = f.fileno()
+        size = fstat(fd).st_size
+        if nocache:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        dropped = 0
+        offset = 0
+
+        def done(n: int):
+            nonlocal dropped, offset
+            offset += n
+            if nocache and offset - dropped >= DROP_SIZE:
+                os.posix_fadvise(fd, dropped, offset - dropped,
+                                 os.POSIX_FADV_DONTNEED)
+                dropped = offset
+            if limiter is not None:
+                limiter.consume(n)
+            if callback is not None:
+                callback(n)
+        try:
+            if use_mmap and size:
+                with mmap(fd, 0, access=ACCESS_READ) as m:
+                    if nocache and hasattr(m, 'madvise'):
+                        m.madvise(MADV_SEQUENTIAL)
+                    with memoryview(m) as view:
+                        for start in range(0, size, block_size):
+                            with view[start:start + block_size] as chunk:
+                                update(chunk)
+                                n = len(chunk)
+                            done(n)
+                return
+            buf = bytearray(block_size)
+            with memoryview(buf) as view:
+                while True:
+                    n = f.readinto(buf)
+                    if not n:
+                        break
+                    with view[:n] as chunk:
+                        update(chunk)
+                    done(n)
+        finally:
+            if nocache:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def hash_file_multi(file: str, methods: Sequence[str],
+                    callback: Optional[ProgressCallback] = None,
+                    block_size: int = BLOCK_SIZE, use_mmap: bool = False,
+                    nocache: bool = False,
+                    limiter: Optional[RateLimiter] = None) -> List[str]:
+    # Every chunk is fed to all hashes, so the file is only read once.
+    hs = [new_hash(m) for m in methods]
+    if len(hs) == 1:
+        update = hs[0].update
+    else:
+        def update(data: memoryview):
+            for h in hs:
+                h.update(data)
+    feed_file(file, update, callback, block_size, use_mmap, nocache, limiter)
+    return [h.hexdigest() for h in hs]
+
+
+def hash_file(file: str, method: str,
+              callback: Optional[ProgressCallback] = None,
+              block_size: int = BLOCK_SIZE, use_mmap: bool = False,
+              nocache: bool = False,
+              limiter: Optional[RateLimiter] = None) -> str:
+    return hash_file_multi(file, [method], callback, block_size, use_mmap,
+                           nocache, limiter)[0]
+
+
+def hash_edges(file: str, method: str, size: int) -> str:
+    # Hashes only the first and the last size bytes of the file. If the file
+    # is not larger than 2 * size, this is the digest of the whole file.
+    h = new_hash(method)
+    with open(file, 'rb', buffering=0) as f:
+        total = fstat(f.fileno()).st_size
+        if total <= size * 2:
+            h.update(f.readall())
+        else:
+            h.update(f.read(size))
+            f.seek(total - size)
+            h.update(f.read(size))
+    return h.hexdigest()
+
+
+def _hash(file: str, method: Method, callback: Optional[ProgressCallback],
+          block_size: int, use_mmap: bool, nocache: bool,
+          limiter: Optional[RateLimiter]) -> Union[str, List[str]]:
+    if isinstance(method, str):
+        return hash_file(file, method, callback, block_size, use_mmap,
+                         nocache, limiter)
+    return hash_file_multi(file, method, callback, block_size, use_mmap,
+                           nocache, limiter)
+
+
+def _hash_job(file: str, method: Method,
+              begin: Optional[Callable[[str], Optional[ProgressCallback]]],
+              end: Optional[Callable[[str], None]],
+              block_size: int, use_mmap: bool, nocache: bool,
+              limiter: Optional[RateLimiter]) -> Union[str, List[str]]:
+    callback = begin(file) if begin is not None else None
+    try:
+        return _hash(file, method, callback, block_size, use_mmap, nocache,
+                     limiter)
+    finally:
+        if end is not None:
+            end(file)
+
+
+def imap_ordered(func: Callable, items: Iterable, jobs: int = 1,
+                 process: bool = False,
+                 ) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+    # Yields (item, func(item), error) in the same order as items, so output
+    # built from it is identical to a serial run whatever jobs is. Only a
+    # bounded window of items is pending, so huge trees do not queue
+    # millions of futures. func must be picklable if process is True.
+    if jobs <= 1:
+        for item in items:
+            try:
+                r = func(item)
+            except Exception as e:
+                yield item, None, e
+            else:
+                yield item, r, None
+        return
+    if process:
+        executor = ProcessPoolExecutor(jobs)
+    else:
+        executor = ThreadPoolExecutor(jobs)
+    pending = deque()
+
+    def collect():
+        item, fut = pending.popleft()
+        try:
+            return item, fut.result(), None
+        except Exception as e:
+            return item, None, e
+
+    try:
+        for item in items:
+            pending.append((item, executor.submit(func, item)))
+            if len(pending) >= jobs * 2:
+                yield collect()
+        while pending:
+            yield collect()
+    finally:
+        for _, fut in pending:
+            fut.cancel()
+        executor.shutdown(wait=True)
+
+
+def iter_hashes(files: Iterable[str], method: Method, jobs: int = 1,
+                process: bool = False,
+                begin: Optional[Callable[[str], Optional[ProgressCallback]]] = None,  # noqa: E501
+                end: Optional[Callable[[str], None]] = None,
+                block_size: int = BLOCK_SIZE, use_mmap: bool = False,
+                nocache: bool = False, bwlimit: Optional[float] = None,
+                ) -> Iterator[Tuple[str, Union[str, List[str], None],
+                                    Optional[Exception]]]:
+    # Yields (file, digest, error) in the same order as files.
+    # If method is a list of methods, digest is a list of digests in the
+    # same order, computed in one read pass.
+    # begin(file) may return a callback which receives the size of every
+    # hashed chunk. On a process pool chunks can not be reported, so the
+    # callback receives the whole file size once the file is done.
+    # bwlimit limits the total read speed in bytes per second.
+    if not process or jobs <= 1:
+        limiter = RateLimiter(bwlimit) if bwlimit else None
+        yield from imap_ordered(partial(_hash_job, method=method, begin=begin,
+                                        end=end, block_size=block_size,
+                                        use_mmap=use_mmap, nocache=nocache,
+                                        limiter=limiter), files, jobs)
+        return
+    # Every worker process gets its own copy of the limiter.
+    limiter = RateLimiter(bwlimit / jobs) if bwlimit else None
+    callbacks = deque()
+
+    def submitted():
+        for file in files:
+            callbacks.append(begin(file) if begin is not None else None)
+            yield file
+    for file, digest, e in imap_ordered(
+            partial(_hash, method=method, callback=None,
+                    block_size=block_size, use_mmap=use_mmap,
+                    nocache=nocache, limiter=limiter),
+            submitted(), jobs, True):
+        callback = callbacks.popleft()
+        if e is None and callback is not None:
+            callback(getsize(file))
+        if end is not None:
+            end(file)
+        yield file, digest, e
+
+
+class HashCache:
+    # Stores digests keyed by path and method. A stored digest is only
+    # returned while size, mtime and inode of the file are unchanged.
+    def __init__(self, path: str, commit_interval: int = 1000):
+        self._db = sqlite3.connect(path)
+        self._db.execute('CREATE TABLE IF NOT EXISTS hashes (path TEXT NOT NULL, method TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, digest TEXT NOT NULL, hashed_at REAL NOT NULL, PRIMARY KEY (path, method));')  # noqa: E501
+        self._commit_interval = commit_interval
+        self._pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    def commit(self):
+        self._db.commit()
+        self._pending = 0
+
+    def lookup(self, path: str, method: str,
+               st: stat_result) -> Optional[Tuple[str, float]]:
+        cur = self._db.execute('SELECT size, mtime_ns, inode, digest, hashed_at FROM hashes WHERE path = ? AND method = ?;', (path, method))  # noqa: E501
+        r = cur.fetchone()
+        if r is None:
+            return None
+        if r[0] != st.st_size or r[1] != st.st_mtime_ns or r[2] != st.st_ino:
+            return None
+        return r[3], r[4]
+
+    def store(self, path: str, method: str, st: stat_result, digest: str,
+              hashed_at: Optional[float] = None):
+        if hashed_at is None:
+            hashed_at = time()
+        self._db.execute('INSERT OR REPLACE INTO hashes (path, method, size, mtime_ns, inode, digest, hashed_at) VALUES (?, ?, ?, ?, ?, ?, ?);', (path, method, st.st_size, st.st_mtime_ns, st.st_ino, digest, hashed_at))  # noqa: E501
+        self._pending += 1
+        if self._pending >= self._commit_interval:
+            self.commit()
+
+    def remove(self, path: str):
+        self._db.execute('DELETE FROM hashes WHERE path = ?;', (path,))
+        self._pending += 1
+
+    def prune(self, paths: Iterable[str]):
+        # Remove entries of files which are not in paths any more.
+        self._db.execute('CREATE TEMP TABLE IF NOT EXISTS seen (path TEXT PRIMARY KEY);')  # noqa: E501
+        self._db.execute('DELETE FROM seen;')
+        self._db.executemany('INSERT OR IGNORE INTO seen (path) VALUES (?);',
+                             ((p,) for p in paths))
+        self._db.execute('DELETE FROM hashes WHERE path NOT IN (SELECT path FROM seen);')  # noqa: E501
+        self._db.execute('DELETE FROM seen;')
+        self.commit()
+
+
+def iter_cached_hashes(files: Iterable[str], methods: Sequence[str],
+                       cache: HashCache,
+                       key: Optional[Callable[[str], str]] = None,
+                       max_age: Optional[float] = None,
+                       on_changed: Optional[Callable[[str, str, str, str], None]] = None,  # noqa: E501
+                       **kwargs,
+                       ) -> Iterator[Tuple[str, Optional[List[str]],
+                                           Optional[Exception]]]:
+    # Same as iter_hashes with a list of methods, but files whose stat is
+    # unchanged reuse the digests stored in cache. Digests older than
+    # max_age seconds are computed again. If such a digest differs although
+    # the file was not modified, on_changed(file, method, old, new) is
+    # called, which usually means the data is corrupted.
+    now = time()
+    order = deque()
+
+    def misses():
+        for file in files:
+            k = key(file) if key is not None else file
+            try:
+                st = stat(file)
+            except OSError:
+                order.append((file, k, None, None, None))
+                yield file
+                continue
+            digests = []
+            old = []
+            for m in methods:
+                r = cache.lookup(k, m, st)
+                old.append(r[0] if r is not None else None)
+                if r is None or (max_age is not None and now - r[1] > max_age):
+                    digests = None
+                elif digests is not None:
+                    digests.append(r[0])
+            order.append((file, k, st, digests, old))
+            if digests is None:
+                yield file
+
+    def flush_hits():
+        while order and order[0][3] is not None:
+            file, _, _, digests, _ = order.popleft()
+            yield file, digests, None
+
+    for file, digests, e in iter_hashes(misses(), list(methods), **kwargs):
+        yield from flush_hits()
+        _, k, st, _, old = order.popleft()
+        if e is None and st is not None:
+            for m, o, d in zip(methods, old, digests):
+                if o is not None and o != d and on_changed is not None:
+                    on_changed(file, m, o, d)
+                cache.store(k, m, st, d)
+        yield file, digests, e
+    yield from flush_hits()
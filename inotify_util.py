@@ -0,0 +1,115 @@
+from ctypes import CDLL, c_char_p, c_int, c_uint32, get_errno
+from ctypes.util import find_library
+from os import close, fsdecode, fsencode, read, strerror
+from select import select
+from struct import Struct
+from typing import Iterator, NamedTuple, Optional
+
+
+IN_ACCESS = 0x00000001
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_CLOSE_NOWRITE = 0x00000010
+IN_OPEN = 0x00000020
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_MASK_ADD = 0x20000000
+IN_ISDIR = 0x40000000
+IN_ONESHOT = 0x80000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+_event = Struct('iIII')
+_libc = None
+
+
+def _load():
+    global _libc
+    if _libc is not None:
+        return _libc
+    libc = CDLL(find_library('c') or 'libc.so.6', use_errno=True)
+    try:
+        libc.inotify_init1.restype = c_int
+        libc.inotify_init1.argtypes = [c_int]
+        libc.inotify_add_watch.restype = c_int
+        libc.inotify_add_watch.argtypes = [c_int, c_char_p, c_uint32]
+        libc.inotify_rm_watch.restype = c_int
+        libc.inotify_rm_watch.argtypes = [c_int, c_int]
+    except AttributeError:
+        raise OSError('inotify is not supported on this system.')
+    _libc = libc
+    return libc
+
+
+def _check(r: int, name: str = None) -> int:
+    if r < 0:
+        e = get_errno()
+        raise OSError(e, strerror(e), name)
+    return r
+
+
+class Event(NamedTuple):
+    wd: int
+    mask: int
+    cookie: int
+    name: str
+
+
+class Inotify:
+    def __init__(self):
+        self._libc = _load()
+        self._fd = _check(self._libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_watch(self, path: str, mask: int) -> int:
+        return _check(self._libc.inotify_add_watch(self._fd, fsencode(path),
+                                                   mask), path)
+
+    def close(self):
+        if self._fd is not None:
+            close(self._fd)
+            self._fd = None
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def read(self, timeout: Optional[float] = None) -> Iterator[Event]:
+        # Waits at most timeout seconds for events. Yields nothing if no
+        # event happened.
+        r = select([self._fd], [], [], timeout)[0]
+        if not r:
+            return
+        try:
+            data = read(self._fd, 65536)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _event.unpack_from(data, offset)
+            offset += _event.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            yield Event(wd, mask, cookie, fsdecode(name))
+
+    def rm_watch(self, wd: int):
+        # The kernel removes the watch itself when the file is deleted.
+        try:
+            _check(self._libc.inotify_rm_watch(self._fd, wd))
+        except OSError:
+            pass
@@ -1,6 +1,7 @@
 from argparse import ArgumentParser
-from os.path import exists, isdir, join
-from os import makedirs, listdir, link
+from os.path import exists, isdir, join, relpath
+from os import makedirs, link
+from util import walk
 
 
 p = ArgumentParser(description='Link files in a directory to another directory.')  # noqa: E501
@@ -16,13 +17,14 @@ def hardlink_files(input: str, output: str, all: bool):
         raise ValueError(f"{output} is not a directory.")
     if not exists(output):
         makedirs(output)
-    for f in listdir(input):
-        if not all and f.startswith('.'):
-            continue
-        src = join(input, f)
-        dst = join(output, f)
-        if isdir(src):
-            hardlink_files(src, dst, all)
+    for e in walk(input, hidden=all, files_only=False):
+        src = e.path
+        dst = join(output, relpath(src, input))
+        if e.is_dir():
+            if exists(dst) and not isdir(dst):
+                raise ValueError(f"{dst} is not a directory.")
+            if not exists(dst):
+                makedirs(dst)
             continue
         if exists(dst):
             print(f"{dst} already exists.")
@@ -1,13 +1,15 @@
-import _rssbotlib
 from argparse import ArgumentParser
 import re
 from typing import List
 from os.path import join, splitext, isdir, exists, split
-from os import listdir, remove, link, symlink, makedirs
+from os import remove, link, symlink, makedirs
 from subprocess import PIPE, Popen
+from probe_cache import ProbeCache, ProbeResult
+from util import walk
 
 
 FMT = re.compile(r"(\d+)(/(\d+))?")
+MUSIC_PATTERNS = ['*.m4a', '*.flac', '*.mp3']
 
 
 def generate_thumb(input: str, output: str):
@@ -20,22 +22,10 @@ def generate_thumb(input: str, output: str):
         raise ValueError(f"Failed to generate thumbnail for {input}")
 
 
-def generate_path(input: str):
+def generate_path(input: str, info: ProbeResult):
     ext = splitext(input)[1]
-    i = _rssbotlib.VideoInfo()
-    if not i.parse(input):
-        raise ValueError(f"Failed to parse {input}")
-    s = i.streams
-    thumb = False
-    for stream in s:
-        if stream.is_video:
-            thumb = True
-            break
-    m = i.meta.to_dict()
-    tmp = {}
-    for i in m:
-        tmp[i.lower()] = m[i]
-    m = tmp
+    thumb = info.has_video
+    m = info.metadata
     artist = m.get('album_artist', m.get('artist', None))
     album = m.get('album', None)
     title = m.get('title', None)
@@ -77,16 +67,7 @@ def generate_path(input: str):
 def get_m4a_files(dir: str, r: bool) -> List[str]:
     if not isdir(dir):
         return []
-    files = listdir(dir)
-    re = []
-    for file in files:
-        file = join(dir, file)
-        if isdir(file):
-            if r:
-                re += get_m4a_files(file, r)
-        elif file.endswith('.m4a') or file.endswith(".flac") or file.endswith(".mp3"):
-            re.append(file)
-    return re
+    return [e.path for e in walk(dir, r, include=MUSIC_PATTERNS)]
 
 
 p = ArgumentParser()
@@ -104,38 +85,47 @@ p.add_argument("-H", "--hardlink", help="Use hard link instead of copy",
                action="store_true", default=False)
 p.add_argument("-d", "--delete", help="Delete output", action="store_true",
                default=False)
+p.add_argument("-j", "--jobs", type=int, default=1,
+               help="Number of files to probe at the same time")
+p.add_argument("--probe-cache", help="Path to the probe cache database, "
+               "default is ~/.cache/pythonscript/probe.db or $PROBE_CACHE, "
+               "use :memory: to disable it")
 arg = p.parse_intermixed_args()
 print(arg)
-for f in get_m4a_files(arg.INPUT, arg.recursive):
-    if arg.verbose:
-        print(f"Processing {f}")
-    r = generate_path(f)
-    if arg.verbose:
-        print(f"Target path: {r[0]}")
-    if r[1]:
-        thumb = r[1]
+with ProbeCache(arg.probe_cache) as cache:
+    files = get_m4a_files(arg.INPUT, arg.recursive)
+    for f, info, e in cache.get_many(files, arg.jobs):
+        if e is not None:
+            raise e
         if arg.verbose:
-            print(f"Target thumb: {thumb}")
-        if arg.delete and exists(thumb):
-            remove(thumb)
-        elif not exists(thumb):
-            makedirs(split(thumb)[0], exist_ok=True)
-            generate_thumb(f, thumb)
-    if exists(r[0]):
-        if arg.delete:
-            remove(r[0])
+            print(f"Processing {f}")
+        r = generate_path(f, info)
+        if arg.verbose:
+            print(f"Target path: {r[0]}")
+        if r[1]:
+            thumb = r[1]
             if arg.verbose:
-                print(f"File {r[0]} deleted.")
-            continue
-        if not arg.force:
-            print(f"File {r[0]} exists, skipped")
-            continue
-    if exists(r[0]):
-        remove(r[0])
-    makedirs(split(r[0])[0], exist_ok=True)
-    if arg.hardlink:
-        link(f, r[0])
-    else:
-        symlink(f, r[0])
-    if arg.verbose:
-        print(f"Linked {f} to {r[0]}")
+                print(f"Target thumb: {thumb}")
+            if arg.delete and exists(thumb):
+                remove(thumb)
+            elif not exists(thumb):
+                makedirs(split(thumb)[0], exist_ok=True)
+                generate_thumb(f, thumb)
+        if exists(r[0]):
+            if arg.delete:
+                remove(r[0])
+                if arg.verbose:
+                    print(f"File {r[0]} deleted.")
+                continue
+            if not arg.force:
+                print(f"File {r[0]} exists, skipped")
+                continue
+        if exists(r[0]):
+            remove(r[0])
+        makedirs(split(r[0])[0], exist_ok=True)
+        if arg.hardlink:
+            link(f, r[0])
+        else:
+            symlink(f, r[0])
+        if arg.verbose:
+            print(f"Linked {f} to {r[0]}")
@@ -0,0 +1,205 @@
+import json
+from os import environ, makedirs, stat, stat_result
+from os.path import abspath, dirname, exists, expanduser, join
+import sqlite3
+from time import time
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+from hash_util import imap_ordered
+
+
+class ProbeResult(NamedTuple):
+    duration: Optional[float]
+    # Every stream is a dict with is_video, and width and height for video
+    # streams.
+    streams: List[dict]
+    # Tag names are lower case.
+    metadata: Dict[str, str]
+
+    @property
+    def has_video(self) -> bool:
+        return any(s['is_video'] for s in self.streams)
+
+    @property
+    def video_size(self) -> Optional[Tuple[int, int]]:
+        for s in self.streams:
+            if s['is_video']:
+                return s['width'], s['height']
+
+
+def normalize_metadata(m: dict) -> Dict[str, str]:
+    return {k.lower(): v for k, v in m.items()}
+
+
+def probe_rssbotlib(path: str) -> ProbeResult:
+    import _rssbotlib
+    i = _rssbotlib.VideoInfo()
+    if not i.parse(path):
+        raise ValueError(f"Failed to parse {path}")
+    streams = []
+    for s in i.streams:
+        if s.is_video:
+            streams.append({'is_video': True, 'width': s.width,
+                            'height': s.height})
+        else:
+            streams.append({'is_video': False})
+    return ProbeResult(i.duration, streams, normalize_metadata(i.meta.to_dict()))  # noqa: E501
+
+
+def probe_ffmpeg_core(path: str) -> ProbeResult:
+    # ffmpeg_core only knows the audio stream and the tags.
+    from ffmpeg_core import COMMON_TAGS, FFMPEGCoreInfo
+    with FFMPEGCoreInfo(path) as i:
+        m = {k: v.decode(errors='replace') if isinstance(v, bytes) else v
+             for k, v in i.metadata(COMMON_TAGS).items()}
+        return ProbeResult(i.length, [{'is_video': False}], m)
+
+
+def default_cache_path() -> str:
+    if environ.get('PROBE_CACHE'):
+        return environ['PROBE_CACHE']
+    base = environ.get('XDG_CACHE_HOME') or join(expanduser('~'), '.cache')
+    return join(base, 'pythonscript', 'probe.db')
+
+
+class ProbeCache:
+    # Stores probe results keyed by the prober and the absolute path. A
+    # stored result is only returned while size and mtime of the file are
+    # unchanged, so probing an unchanged library again does not open any
+    # file. Probers see different streams, so results of one prober are
+    # never returned to another; name defaults to the name of prober.
+    def __init__(self, path: Optional[str] = None,
+                 prober: Callable[[str], ProbeResult] = probe_rssbotlib,
+                 commit_interval: int = 1000, name: Optional[str] = None):
+        if path is None:
+            path = default_cache_path()
+        if path != ':memory:' and dirname(path):
+            makedirs(dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        cols = [r[1] for r in self._db.execute('PRAGMA table_info(probes);')]  # noqa: E501
+        if cols and 'prober' not in cols:
+            # Created by an older version, it is only a cache.
+            self._db.execute('DROP TABLE probes;')
+        self._db.execute('CREATE TABLE IF NOT EXISTS probes (prober TEXT NOT NULL, path TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, duration REAL, streams TEXT NOT NULL, metadata TEXT NOT NULL, probed_at REAL NOT NULL, PRIMARY KEY (prober, path));')  # noqa: E501
+        self.prober = prober
+        self.name = name if name is not None else prober.__name__
+        self._commit_interval = commit_interval
+        self._pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def clear(self):
+        self._db.execute('DELETE FROM probes WHERE prober = ?;', (self.name,))
+        self.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    def commit(self):
+        if self._db is not None:
+            self._db.commit()
+        self._pending = 0
+
+    def get(self, path: str) -> ProbeResult:
+        # Raises the error of the prober if the file can not be probed.
+        for _, r, e in self.get_many([path]):
+            if e is not None:
+                raise e
+            return r
+
+    def get_many(self, paths: Iterable[str], jobs: int = 1,
+                 process: bool = False) -> Iterator[Tuple[str, Optional[ProbeResult], Optional[Exception]]]:  # noqa: E501
+        # Yields (path, result, error) in the order of paths. Cached results
+        # are looked up in batches, the other files are probed on jobs
+        # workers and stored with the stat taken before probing, so a file
+        # modified during the probe is probed again next time.
+        paths = list(paths)
+        stats = self._stat(paths)
+        found = self._lookup(stats)
+        misses = [p for p in paths if p not in found]
+        probed = imap_ordered(self.prober, misses, jobs, process)
+        try:
+            for p in paths:
+                if p in found:
+                    yield p, found[p], None
+                    continue
+                _, r, e = next(probed)
+                if e is None and p in stats:
+                    self.store(p, r, stats[p])
+                yield p, r, e
+        finally:
+            probed.close()
+            self.commit()
+
+    def invalidate(self, paths: Iterable[str]):
+        self._db.executemany('DELETE FROM probes WHERE prober = ? AND path = ?;',  # noqa: E501
+                             ((self.name, abspath(p)) for p in paths))
+        self.commit()
+
+    def lookup(self, path: str) -> Optional[ProbeResult]:
+        return self.lookup_many([path]).get(path)
+
+    def lookup_many(self, paths: Iterable[str],
+                    batch: int = 500) -> Dict[str, ProbeResult]:
+        # Returns the results of files which are cached and unchanged.
+        return self._lookup(self._stat(paths), batch)
+
+    def _lookup(self, stats: Dict[str, stat_result],
+                batch: int = 500) -> Dict[str, ProbeResult]:
+        keys = {abspath(p): (p, st.st_size, st.st_mtime_ns)
+                for p, st in stats.items()}
+        r = {}
+        ks = list(keys)
+        for i in range(0, len(ks), batch):
+            b = ks[i:i + batch]
+            cur = self._db.execute(f'SELECT path, size, mtime_ns, duration, streams, metadata FROM probes WHERE prober = ? AND path IN ({", ".join("?" * len(b))});', [self.name] + b)  # noqa: E501
+            for k, size, mtime_ns, duration, streams, metadata in cur:
+                p, s, m = keys[k]
+                if s == size and m == mtime_ns:
+                    r[p] = ProbeResult(duration, json.loads(streams),
+                                       json.loads(metadata))
+        return r
+
+    def prune(self):
+        # Removes results of files which do not exist any more, of all
+        # probers.
+        cur = self._db.execute('SELECT DISTINCT path FROM probes;')
+        gone = [(p,) for p, in cur if not exists(p)]
+        self._db.executemany('DELETE FROM probes WHERE path = ?;', gone)
+        self.commit()
+        return len(gone)
+
+    def _stat(self, paths: Iterable[str]) -> Dict[str, stat_result]:
+        # Files which can not be stat'ed are left out.
+        r = {}
+        for p in paths:
+            try:
+                r[p] = stat(p)
+            except OSError:
+                pass
+        return r
+
+    def store(self, path: str, r: ProbeResult,
+              st: Optional[stat_result] = None):
+        # st should be taken before the file was probed.
+        if st is None:
+            st = stat(path)
+        self._db.execute('INSERT OR REPLACE INTO probes (prober, path, size, mtime_ns, duration, streams, metadata, probed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?);', (self.name, abspath(path), st.st_size, st.st_mtime_ns, r.duration, json.dumps(r.streams), json.dumps(r.metadata, ensure_ascii=False), time()))  # noqa: E501
+        self._pending += 1
+        if self._pending >= self._commit_interval:
+            self.commit()
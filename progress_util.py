@@ -0,0 +1,174 @@
+import sys
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Dict, List, Optional, TextIO
+try:
+    from rich.console import Group
+    from rich.live import Live
+    from rich.progress import (
+        Progress,
+        SpinnerColumn,
+        BarColumn,
+        TextColumn,
+        MofNCompleteColumn,
+    )
+    from rich.table import Table
+    have_rich = True
+except ImportError:
+    have_rich = False
+
+
+def format_size(n: float) -> str:
+    for unit in ['B', 'KiB', 'MiB', 'GiB', 'TiB']:
+        if n < 1024 or unit == 'TiB':
+            break
+        n /= 1024
+    return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.2f} {unit}"
+
+
+class ProgressReporter:
+    # Progress of many files which are processed by several workers.
+    # Workers only add byte counts to their own slot, the display is
+    # updated by a background thread interval seconds apart. A rich live
+    # display with the window most recently started files is used if
+    # output is a terminal, otherwise a plain line is written to stderr
+    # every log_interval seconds.
+    def __init__(self, description: str, total: Optional[int] = None,
+                 interval: float = 0.1, window: int = 5,
+                 log_interval: float = 10, stream: TextIO = None):
+        self.description = description
+        self._total = total
+        self.interval = interval
+        self.window = window
+        self.log_interval = log_interval
+        self._stream = sys.stderr if stream is None else stream
+        self.rich = have_rich and sys.stdout.isatty()
+        self._lock = Lock()
+        # name -> [done bytes, size]
+        self._active: Dict[str, List[int]] = {}
+        self._done_files = 0
+        self._done_bytes = 0
+        self._stop = Event()
+        self._thread = None
+        self._start = None
+        self._last_log = None
+        if self.rich:
+            self._progress = Progress("{task.description}",
+                                      SpinnerColumn(),
+                                      BarColumn(),
+                                      TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),  # noqa: E501
+                                      MofNCompleteColumn(),
+                                      TextColumn("{task.fields[status]}"),
+                                      )
+            self._task = self._progress.add_task(description, total=total,
+                                                 status='')
+            self._live = Live(self._render(), auto_refresh=False)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def total(self) -> Optional[int]:
+        return self._total
+
+    @total.setter
+    def total(self, total: Optional[int]):
+        # Can be changed while running, e.g. when the total was estimated.
+        self._total = total
+        if self.rich:
+            self._progress.update(self._task, total=total)
+
+    def advance(self, files: int = 1):
+        with self._lock:
+            self._done_files += files
+
+    def begin(self, name: str, size: int):
+        # Returns the callback which adds the processed bytes of the file.
+        slot = [0, size]
+        with self._lock:
+            self._active[name] = slot
+
+        def callback(n: int):
+            slot[0] += n
+        return callback
+
+    def end(self, name: str):
+        with self._lock:
+            slot = self._active.pop(name, None)
+            if slot is not None:
+                self._done_bytes += slot[0]
+
+    def print(self, *args, **kwargs):
+        if self.rich:
+            self._live.console.print(*args, **kwargs)
+        else:
+            print(*args, **kwargs)
+
+    def start(self):
+        self._start = self._last_log = monotonic()
+        if self.rich:
+            self._live.start()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if self.rich:
+            self._publish()
+            self._live.stop()
+        elif self._last_log != self._start:
+            # Only write the summary if a progress line is written before.
+            self._log()
+
+    def _snapshot(self):
+        with self._lock:
+            active = list(self._active.items())
+            files = self._done_files
+            done = self._done_bytes
+        done += sum(s[0] for _, s in active)
+        return files, done, active
+
+    def _status(self, done: int) -> str:
+        elapsed = monotonic() - self._start
+        speed = done / elapsed if elapsed > 0 else 0
+        return f"{format_size(done)} {format_size(speed)}/s"
+
+    def _render(self, active=()):
+        table = Table.grid()
+        table.add_row(self._progress)
+        for name, (n, size) in active[-self.window:]:
+            percent = n / size * 100 if size else 100
+            table.add_row(f"{percent:>3.0f}% {name}")
+        if len(active) > self.window:
+            table.add_row(f"... and {len(active) - self.window} more files")
+        return Group(table)
+
+    def _publish(self):
+        files, done, active = self._snapshot()
+        self._progress.update(self._task, completed=files,
+                              status=self._status(done))
+        self._live.update(self._render(active), refresh=True)
+
+    def _log(self):
+        files, done, active = self._snapshot()
+        total = f"/{self.total}" if self.total is not None else ''
+        t = f"{self.description} {files}{total} files, {self._status(done)}"
+        if active:
+            t += f", {active[-1][0]}"
+        print(t, file=self._stream, flush=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.rich:
+                self._publish()
+            elif monotonic() - self._last_log >= self.log_interval:
+                self._last_log = monotonic()
+                self._log()
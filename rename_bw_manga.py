@@ -1,10 +1,10 @@
 from argparse import ArgumentParser
 from json import loads
-from os import listdir
-from os.path import exists, isdir, join, splitext
+from os.path import exists, isdir, splitext
 from shutil import move
 from typing import List
 from zipfile import ZipFile
+from util import walk
 
 
 p = ArgumentParser()
@@ -20,16 +20,7 @@ def get_zip_files(dir: str, r: bool) -> List[str]:
         if exists(dir) and dir.endswith('.zip'):
             return [dir]
         return []
-    files = listdir(dir)
-    re = []
-    for file in files:
-        file = join(dir, file)
-        if isdir(file):
-            if r:
-                re += get_zip_files(file, r)
-        elif file.endswith('.zip'):
-            re.append(file)
-    return re
+    return [e.path for e in walk(dir, r, include=['*.zip'])]
 
 
 def rename_zip(file: str, json_path: str, verbose: bool):
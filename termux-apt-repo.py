@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
-import datetime, hashlib, os, re, shutil, subprocess, sys, glob, argparse
+import datetime, os, re, shutil, subprocess, sys, glob, argparse
+from hash_util import hash_file_multi
 
 COMPONENTS = []
 supported_arches = ['all', 'arm', 'i686', 'aarch64', 'x86_64']
@@ -150,12 +151,13 @@ for component in COMPONENTS:
                 # Add these fields which dpkg-scanpackages would have done:
                 scanpackages_output += '\nFilename: ' + os.path.join('dists', DISTRIBUTION, component, binary_path, os.path.basename(deb_to_read_path)).replace('\\', '/')
                 scanpackages_output += '\nSize: ' + str(os.stat(deb_to_read_path).st_size)
-                for hash in hashes:
+                # Read the .deb once for all hashes
+                for hash, digest in zip(hashes, hash_file_multi(deb_to_read_path, hashes)):
                     if hash == "md5":
                         hash_string = hash.upper()+'Sum'
                     else:
                         hash_string = hash.upper()
-                    scanpackages_output += '\n'+hash_string + ': ' + getattr(hashlib, hash)(open(deb_to_read_path, 'rb').read()).hexdigest()
+                    scanpackages_output += '\n'+hash_string + ': ' + digest
                 print(scanpackages_output, file=packages_file)
                 print('', file=packages_file)
         # Create Packages.xz
@@ -165,26 +167,27 @@ for component in COMPONENTS:
 
 # Get components in output folder, we might have more folders than we are adding now
 COMPONENTS = [d for d in os.listdir(distribution_path) if os.path.isdir(os.path.join(distribution_path, d))]
-for hash in hashes:
+# Hash every index file once for all hashes before writing the per-hash sections
+release_entries = []
+for component in COMPONENTS:
+    for arch_dir_path in glob.glob(os.path.join(distribution_path, component, 'binary-*')):
+        # Packages and Packages.xz are listed in the Release file:
+        for f in ['Packages', 'Packages.xz']:
+            release_entries.append((os.path.join(arch_dir_path, f),
+                                    os.path.join(component, os.path.basename(arch_dir_path), f).replace('\\', '/')))
+    # Contents and Contents.xz are listed in the Release file:
+    for contents_file in glob.glob(os.path.join(distribution_path, component, 'Contents-*')):
+        release_entries.append((contents_file, os.path.relpath(contents_file, distribution_path).replace('\\', '/')))
+release_digests = [hash_file_multi(path, hashes) for path, _ in release_entries]
+for i, hash in enumerate(hashes):
     if hash == 'md5':
         hash_string = hash.upper()+'Sum'
     else:
         hash_string = hash.upper()
     print(hash_string + ':', file=release_file)
 
-    for component in COMPONENTS:
-        for arch_dir_path in glob.glob(os.path.join(distribution_path, component, 'binary-*')):
-            # Write info about Packages and Packages.xz to Release file:
-            for f in ['Packages', 'Packages.xz']:
-                print(' '+' '.join([getattr(hashlib, hash)(open(os.path.join(arch_dir_path, f), 'rb').read()).hexdigest(),
-                                    str(os.stat(os.path.join(arch_dir_path, f)).st_size),
-                                    os.path.join(component, os.path.basename(arch_dir_path), f).replace('\\', '/')])
-                      , file=release_file)
-        # Write info about Contents and Contents.gz to Release file:
-        for contents_file in glob.glob(os.path.join(distribution_path, component, 'Contents-*')):
-            print(' '+' '.join([getattr(hashlib, hash)(open(contents_file, 'rb').read()).hexdigest(),
-                                str(os.stat(contents_file).st_size), os.path.relpath(contents_file, distribution_path).replace('\\', '/')])
-                  , file=release_file)
+    for (path, name), digests in zip(release_entries, release_digests):
+        print(' '+' '.join([digests[i], str(os.stat(path).st_size), name]), file=release_file)
 release_file.close()
 
 if True:
@@ -1,11 +1,14 @@
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from os import DirEntry, scandir
 from time import strftime, localtime, timezone
-from typing import List
+from typing import Iterator, List, Optional
 try:
     from dateutil.parser import parse
     have_dateutil = True
 except ImportError:
-    print('Warning: python-dateutil not found. -s and -e only accept integer now.')  # noqa: E501
     have_dateutil = False
+_warned_dateutil = False
 
 
 def timeToStr(t: int) -> str:
@@ -23,6 +26,10 @@ def tparse(s: str) -> int:
         if have_dateutil:
             return round(parse(s).timestamp())
         else:
+            global _warned_dateutil
+            if not _warned_dateutil:
+                print('Warning: python-dateutil not found. -s and -e only accept integer now.')  # noqa: E501
+                _warned_dateutil = True
             raise ValueError()
 
 
@@ -50,3 +57,55 @@ def commandLineToArgv(c: str) -> List[str]:
         else:
             r.append(i)
     return r
+
+
+def _scandir(path: str) -> List[DirEntry]:
+    with scandir(path) as it:
+        return list(it)
+
+
+def walk(top: str, recursive: bool = True, hidden: bool = True,
+         include: Optional[List[str]] = None,
+         exclude: Optional[List[str]] = None, files_only: bool = True,
+         jobs: int = 1) -> Iterator[DirEntry]:
+    # Yields entries lazily in the same depth first order as a recursive
+    # listdir. DirEntry caches the file type, so no extra stat is needed.
+    # include/exclude are glob patterns matched against the entry name,
+    # include only applies to files. When files_only is False, directories
+    # are yielded before their content and entries of other types are
+    # yielded too. jobs > 1 lists subdirectories in advance on a thread
+    # pool, which helps on network filesystems.
+    def accept(e: DirEntry, is_dir: bool) -> bool:
+        if not hidden and e.name.startswith('.'):
+            return False
+        if exclude and any(fnmatchcase(e.name, p) for p in exclude):
+            return False
+        if not is_dir and include:
+            return any(fnmatchcase(e.name, p) for p in include)
+        return True
+
+    def iterate(entries: List[DirEntry]) -> Iterator[DirEntry]:
+        entries = [(e, d) for e, d in ((e, e.is_dir()) for e in entries)
+                   if accept(e, d)]
+        prefetch = {}
+        if recursive and executor is not None:
+            for e, d in entries:
+                if d:
+                    prefetch[e.path] = executor.submit(_scandir, e.path)
+        for e, d in entries:
+            if d:
+                if not files_only:
+                    yield e
+                if recursive:
+                    fut = prefetch.pop(e.path, None)
+                    sub = fut.result() if fut is not None else _scandir(e.path)
+                    yield from iterate(sub)
+            elif not files_only or e.is_file():
+                yield e
+
+    executor = ThreadPoolExecutor(jobs) if jobs > 1 else None
+    try:
+        yield from iterate(_scandir(top))
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)